@@ -1,17 +1,54 @@
 import struct
 import os
 import csv
+import heapq
+import math
+import mmap
+import re
+import tempfile
+import numpy as np
+from collections import OrderedDict
 
 class Venta:
+    # nombre y fecha pueden quedar como los bytes del nodo: se decodifican recien cuando
+    # alguien los lee (search_rango devuelve muchas ventas de las que a veces solo se usa el id)
+    __slots__ = ("id", "_nombre", "cantidad", "precio", "_fecha", "izq", "der")
+
     def __init__(self, id, nombre, cantidad, precio, fecha, izq=-1, der=-1):
         self.id = id
-        self.nombre = nombre
+        self._nombre = nombre
         self.cantidad = cantidad
         self.precio = precio
-        self.fecha = fecha
+        self._fecha = fecha
         self.izq = izq
         self.der = der
 
+    @property
+    def nombre(self):
+        if isinstance(self._nombre, bytes):
+            self._nombre = self._nombre.decode().strip('\x00')
+        return self._nombre
+
+    @nombre.setter
+    def nombre(self, valor):
+        self._nombre = valor
+
+    @property
+    def fecha(self):
+        if isinstance(self._fecha, bytes):
+            self._fecha = self._fecha.decode().strip('\x00')
+        return self._fecha
+
+    @fecha.setter
+    def fecha(self, valor):
+        self._fecha = valor
+
+    def nombre_bytes(self):
+        return self._nombre if isinstance(self._nombre, bytes) else self._nombre.encode()
+
+    def fecha_bytes(self):
+        return self._fecha if isinstance(self._fecha, bytes) else self._fecha.encode()
+
     def get(self):
         print(self.id, end='|')
         print(self.nombre, end='|')
@@ -21,126 +58,682 @@ class Venta:
 
 FORMAT = "i30sif10sii"
 RECORD_SIZE = struct.calcsize(FORMAT)
+# offset de izq/der dentro del registro, para navegar sin decodificar todo el nodo
+LINKS_OFFSET = RECORD_SIZE - struct.calcsize("ii")
+# offset de cantidad/precio ("if"), para agregar sin decodificar nombre ni fecha
+VALUES_OFFSET = struct.calcsize("i30si") - 4
+# campos que acepta aggregate_range (indice dentro de la tupla (cantidad, precio))
+AGG_FIELDS = {"cantidad": 0, "precio": 1}
+# el mismo layout que FORMAT como dtype estructurado, para (de)codificar bloques enteros
+RECORD_DTYPE = np.dtype({
+    "names": ["id", "nombre", "cantidad", "precio", "fecha", "izq", "der"],
+    "formats": ["i4", "S30", "i4", "f4", "S10", "i4", "i4"],
+    "offsets": [0, 4, VALUES_OFFSET, VALUES_OFFSET + 4, struct.calcsize("i30sif"), LINKS_OFFSET, LINKS_OFFSET + 4],
+    "itemsize": RECORD_SIZE,
+})
+# registros por bloque en los recorridos completos y al escribir runs
+BLOQUE = 4096
+AGG_PATTERN = re.compile(r"(sum|min|max|avg)\((\w+)(?:\*(\w+))?\)")
+CACHE_SIZE = 1024
+# metadatos en archivo aparte: cabeza de la lista de slots libres, cuantos hay
+# y el tamaño maximo alcanzado desde el ultimo rebuild (modo balanceado)
+META_FORMAT = "iii"
+# modo balanceado (scapegoat): ningun hijo puede tener mas de ALPHA del subarbol
+ALPHA = 2 / 3
+# registros que bulk_load ordena en memoria antes de volcar un run a disco
+RUN_SIZE = 100000
+# fraccion de slots muertos a partir de la cual delete dispara compact()
+COMPACT_THRESHOLD = 0.3
+
+def venta_a_nodo(registro, izq=-1, der=-1):
+    return (registro.id, registro.nombre_bytes().ljust(30, b'\x00'), registro.cantidad, registro.precio,
+            registro.fecha_bytes().ljust(10, b'\x00'), izq, der)
+
+def nodo_libre(siguiente):
+    # un slot libre es una lapida (id == -1) cuyo izq apunta al siguiente slot libre
+    return (-1, b'', 0, 0.0, b'', siguiente, -1)
+
+def nodo_a_venta(nodo):
+    id, nombre, cantidad, precio, fecha, izq, der = nodo
+    return Venta(id, nombre, cantidad, precio, fecha, izq, der)
+
+def codificar(nodos):
+    # lista de nodos (tuplas) -> bytes, en una sola pasada de numpy
+    bloque = np.zeros(len(nodos), dtype=RECORD_DTYPE)
+    bloque[:] = nodos
+    return bloque.tobytes()
+
+def decodificar(data):
+    # bytes -> nodos (tuplas); nombre y fecha quedan como bytes sin el relleno final
+    return np.frombuffer(data, dtype=RECORD_DTYPE, count=len(data) // RECORD_SIZE).tolist()
+
+def escribir_run(nodos):
+    f = tempfile.TemporaryFile()
+    pendientes = []
+    for nodo in nodos:
+        pendientes.append(nodo)
+        if len(pendientes) >= BLOQUE:
+            f.write(codificar(pendientes))
+            pendientes = []
+    if pendientes:
+        f.write(codificar(pendientes))
+    f.seek(0)
+    return f
+
+def leer_run(f):
+    while True:
+        data = f.read(BLOQUE * RECORD_SIZE)
+        if len(data) < RECORD_SIZE:
+            break
+        yield from decodificar(data)
+
+def sin_duplicados(nodos):
+    # la entrada viene ordenada; se queda con la primera aparicion de cada id
+    ultimo = None
+    for nodo in nodos:
+        if nodo[0] != ultimo:
+            ultimo = nodo[0]
+            yield nodo
+
+def arbol_balanceado(n):
+    # recorre in-order el arbol implicito que parte [0, n) por la mediana
+    # y devuelve (indice, indice_izq, indice_der) en orden creciente
+    pila = []
+    lo, hi = 0, n
+    while pila or lo < hi:
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pila.append((lo, mid, hi))
+            hi = mid
+        lo, mid, hi = pila.pop()
+        izq = (lo + mid) // 2 if lo < mid else -1
+        der = (mid + 1 + hi) // 2 if mid + 1 < hi else -1
+        yield mid, izq, der
+        lo = mid + 1
+
+def compilar_agregados(ops):
+    # "count", "sum(cantidad)", "sum(cantidad*precio)", "min(precio)", "max(precio)", "avg(...)"
+    plan = []
+    for op in ops:
+        expr = op.replace(" ", "")
+        if expr == "count":
+            plan.append(("count", ()))
+            continue
+        match = AGG_PATTERN.fullmatch(expr)
+        campos = [campo for campo in match.groups()[1:] if campo is not None] if match else []
+        if not match or any(campo not in AGG_FIELDS for campo in campos):
+            raise ValueError(f"unsupported aggregate: {op}")
+        plan.append((match.group(1), tuple(AGG_FIELDS[campo] for campo in campos)))
+    return plan
+
+def agregar(valores, ops):
+    # valores: tuplas (cantidad, precio) leidas de los bytes; devuelve {op: resultado}
+    plan = compilar_agregados(ops)
+    count = 0
+    acc = [None] * len(plan)
+    for fila in valores:
+        count += 1
+        for i, (tipo, campos) in enumerate(plan):
+            if tipo == "count":
+                continue
+            valor = fila[campos[0]] if len(campos) == 1 else fila[campos[0]] * fila[campos[1]]
+            actual = acc[i]
+            if actual is None:
+                acc[i] = valor
+            elif tipo in ("sum", "avg"):
+                acc[i] = actual + valor
+            elif (valor < actual) if tipo == "min" else (valor > actual):
+                acc[i] = valor
+
+    resultado = {}
+    for op, (tipo, _), valor in zip(ops, plan, acc):
+        if tipo == "count":
+            resultado[op] = count
+        elif tipo == "sum":
+            resultado[op] = valor if valor is not None else 0
+        elif tipo == "avg":
+            resultado[op] = valor / count if count else None
+        else:
+            resultado[op] = valor
+    return resultado
 
 class BST_File:
-    def __init__(self, BST_Filename):
+    def __init__(self, BST_Filename, cache_size=CACHE_SIZE, balanced=False, use_mmap=False, compact_threshold=COMPACT_THRESHOLD):
         self.BST_Filename = BST_Filename
+        self.balanced = balanced
+        # None: compact() solo se ejecuta a mano
+        self.compact_threshold = compact_threshold
         if not os.path.exists(self.BST_Filename):
             with open(self.BST_Filename, "wb") as f:
                 pass
+        # un solo handle abierto durante toda la vida del objeto
+        self.f = open(self.BST_Filename, "rb+")
+        # cache LRU de nodos decodificados: posicion -> tupla
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        # modo mmap: las lecturas salen directo del buffer mapeado y no usan la cache
+        self.use_mmap = use_mmap
+        self.mm = None
+        # durante insert_many: nodos modificados que aun no se escribieron (posicion -> tupla)
+        self.dirty = None
+        self.batch_slots = 0
+        self.remap()
+        self.meta_filename = self.BST_Filename + ".meta"
+        self.free_head, self.free_count, self.max_size = -1, 0, 0
+        if not os.path.exists(self.meta_filename):
+            open(self.meta_filename, "wb").close()
+        # el .meta tambien queda abierto: se reescribe en cada cambio de la lista de libres
+        self.meta_f = open(self.meta_filename, "rb+")
+        data = self.meta_f.read(struct.calcsize(META_FORMAT))
+        if self.slots() == 0:
+            # archivo nuevo o vacio: un .meta anterior ya no aplica
+            self.write_meta()
+        elif len(data) == struct.calcsize(META_FORMAT):
+            self.free_head, self.free_count, self.max_size = struct.unpack(META_FORMAT, data)
+
+    def write_meta(self):
+        if self.dirty is not None:
+            return
+        self.meta_f.seek(0)
+        self.meta_f.write(struct.pack(META_FORMAT, self.free_head, self.free_count, self.max_size))
+
+    def remap(self):
+        if not self.use_mmap:
+            return
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.f.flush()
+        if self.slots() > 0:
+            self.mm = mmap.mmap(self.f.fileno(), 0)
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        if self.meta_f is not None:
+            self.meta_f.close()
+            self.meta_f = None
+        self.cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def cache_node(self, pos, nodo):
+        self.cache[pos] = nodo
+        self.cache.move_to_end(pos)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get_node_at(self, pos):
+        if self.dirty is not None and pos in self.dirty:
+            return self.dirty[pos]
+        if self.use_mmap:
+            offset = pos * RECORD_SIZE
+            if self.mm is None or offset + RECORD_SIZE > len(self.mm):
+                return None
+            return struct.unpack_from(FORMAT, self.mm, offset)
+        nodo = self.cache.get(pos)
+        if nodo is not None:
+            self.cache.move_to_end(pos)
+            return nodo
+        self.f.seek(pos * RECORD_SIZE)
+        data = self.f.read(RECORD_SIZE)
+        if len(data) < RECORD_SIZE:
+            return None
+        nodo = struct.unpack(FORMAT, data)
+        self.cache_node(pos, nodo)
+        return nodo
+
+    def get_links_at(self, pos):
+        # solo (id, izq, der): lo necesario para bajar por el arbol
+        if self.use_mmap and not (self.dirty is not None and pos in self.dirty):
+            offset = pos * RECORD_SIZE
+            return struct.unpack_from("i", self.mm, offset) + struct.unpack_from("ii", self.mm, offset + LINKS_OFFSET)
+        nodo = self.get_node_at(pos)
+        return nodo[0], nodo[5], nodo[6]
+
+    def get_values_at(self, pos):
+        # (id, izq, der, cantidad, precio): los nodos que no estan en memoria se leen
+        # crudos, sin decodificar nombre ni fecha y sin pasar por la cache
+        nodo = None
+        if self.dirty is not None and pos in self.dirty:
+            nodo = self.dirty[pos]
+        elif not self.use_mmap:
+            nodo = self.cache.get(pos)
+        if nodo is not None:
+            return nodo[0], nodo[5], nodo[6], nodo[2], nodo[3]
+        if self.use_mmap:
+            data, offset = self.mm, pos * RECORD_SIZE
+        else:
+            self.f.seek(pos * RECORD_SIZE)
+            data, offset = self.f.read(RECORD_SIZE), 0
+        return (struct.unpack_from("i", data, offset) + struct.unpack_from("ii", data, offset + LINKS_OFFSET)
+                + struct.unpack_from("if", data, offset + VALUES_OFFSET))
+
+    def write_node_at(self, nodo, pos):
+        if self.dirty is not None:
+            self.dirty[pos] = nodo
+            return
+        if self.use_mmap and self.mm is not None and (pos + 1) * RECORD_SIZE <= len(self.mm):
+            self.mm[pos * RECORD_SIZE:(pos + 1) * RECORD_SIZE] = struct.pack(FORMAT, *nodo)
+            return
+        self.f.seek(pos * RECORD_SIZE)
+        self.f.write(struct.pack(FORMAT, *nodo))
+        self.cache_node(pos, nodo)
+
+    def append_node(self, nodo):
+        pos = self.slots()
+        self.write_node_at(nodo, pos)
+        if self.dirty is not None:
+            self.batch_slots += 1
+        else:
+            self.remap()
+        return pos
+
+    def new_node(self, nodo):
+        # reutiliza un slot liberado por delete antes de crecer el archivo
+        if self.free_head == -1:
+            return self.append_node(nodo)
+        pos = self.free_head
+        self.free_head = self.get_node_at(pos)[5]
+        self.free_count -= 1
+        self.write_meta()
+        self.write_node_at(nodo, pos)
+        return pos
+
+    def free_node(self, pos):
+        self.write_node_at(nodo_libre(self.free_head), pos)
+        self.free_head = pos
+        self.free_count += 1
+        self.write_meta()
+
+    def slots(self):
+        if self.dirty is not None:
+            return self.batch_slots
+        self.f.seek(0, os.SEEK_END)
+        return self.f.tell() // RECORD_SIZE
+
+    def insert_many(self, registros):
+        # las escrituras del lote se acumulan en memoria y se vuelcan juntas al final
+        self.batch_slots = self.slots()
+        self.dirty = {}
+        try:
+            for registro in registros:
+                self.insert(registro)
+        finally:
+            self.flush_batch()
+
+    def flush_batch(self):
+        dirty, self.dirty = self.dirty, None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        # posiciones consecutivas (p. ej. todos los nodos agregados al final) van en un solo write
+        posiciones = sorted(dirty)
+        i = 0
+        while i < len(posiciones):
+            j = i + 1
+            while j < len(posiciones) and posiciones[j] == posiciones[j - 1] + 1:
+                j += 1
+            self.f.seek(posiciones[i] * RECORD_SIZE)
+            self.f.write(b''.join(struct.pack(FORMAT, *dirty[pos]) for pos in posiciones[i:j]))
+            i = j
+        for pos in posiciones:
+            if pos in self.cache:
+                self.cache[pos] = dirty[pos]
+        self.remap()
+        self.write_meta()
+
+    def size(self):
+        return self.slots() - self.free_count
 
     def insert(self, registro):
-        with open(self.BST_Filename, "rb+") as f:
-            f.seek(0, os.SEEK_END)
-            size = f.tell()
-            if size == 0:
-                to_write = struct.pack( FORMAT,registro.id,registro.nombre.encode().ljust(30, b'\x00'),
-                        registro.cantidad,registro.precio, registro.fecha.encode().ljust(10, b'\x00'),-1,-1)
-                f.write(to_write)
-                return
+        if self.slots() == 0:
+            self.append_node(venta_a_nodo(registro))
+            if self.balanced:
+                self.max_size = 1
+                self.write_meta()
+            return
         self.insert_pos(registro, 0)
 
     def insert_pos(self, registro, pos):
-        with open(self.BST_Filename, "rb+") as f:
-            while True:
-                f.seek(pos * RECORD_SIZE)
-                data = f.read(RECORD_SIZE)
-                pid, pnombre, pcantidad, pprecio, pfecha, pizq, pder = struct.unpack(FORMAT, data)
-
-                if registro.id < pid:
-                    if pizq != -1:
-                        pos = pizq
-                    else:
-                        f.seek(0, os.SEEK_END)
-                        new_pos = f.tell() // RECORD_SIZE
-                        to_write = struct.pack( FORMAT,registro.id,registro.nombre.encode().ljust(30, b'\x00'),
-                            registro.cantidad,registro.precio, registro.fecha.encode().ljust(10, b'\x00'),-1,-1)
-                        f.write(to_write)
-                        pizq = new_pos
-                        f.seek(pos * RECORD_SIZE)
-                        f.write(struct.pack(FORMAT, pid, pnombre, pcantidad, pprecio, pfecha, pizq, pder))
-                        break
-                elif registro.id > pid:
-                    if pder != -1:
-                        pos = pder
-                    else:
-                        f.seek(0, os.SEEK_END)
-                        new_pos = f.tell() // RECORD_SIZE
-                        to_write = struct.pack( FORMAT,registro.id,registro.nombre.encode().ljust(30, b'\x00'),
-                            registro.cantidad,registro.precio, registro.fecha.encode().ljust(10, b'\x00'),-1,-1)
-                        f.write(to_write)
-                        pder = new_pos
-                        f.seek(pos * RECORD_SIZE)
-                        f.write(struct.pack(FORMAT, pid, pnombre, pcantidad, pprecio, pfecha, pizq, pder))
-                        break
+        camino = []
+        while True:
+            pid, pizq, pder = self.get_links_at(pos)
+            camino.append(pos)
+
+            if registro.id < pid:
+                if pizq != -1:
+                    pos = pizq
                 else:
-                    break 
+                    pizq = self.new_node(venta_a_nodo(registro))
+                    self.write_node_at(self.get_node_at(pos)[:5] + (pizq, pder), pos)
+                    camino.append(pizq)
+                    break
+            elif registro.id > pid:
+                if pder != -1:
+                    pos = pder
+                else:
+                    pder = self.new_node(venta_a_nodo(registro))
+                    self.write_node_at(self.get_node_at(pos)[:5] + (pizq, pder), pos)
+                    camino.append(pder)
+                    break
+            else:
+                return
+
+        if self.balanced:
+            self.rebalance_insert(camino)
+
+    def rebalance_insert(self, camino):
+        # scapegoat: si el nuevo nodo quedo mas profundo que log_{1/ALPHA}(n), se sube
+        # por el camino hasta el primer ancestro desbalanceado y se reconstruye su subarbol
+        n = self.size()
+        self.max_size = max(self.max_size, n)
+        self.write_meta()
+        if len(camino) - 1 <= math.log(n, 1 / ALPHA):
+            return
+        hijo = camino[-1]
+        tam_hijo = 1
+        for pos in reversed(camino[:-1]):
+            _, izq, der = self.get_links_at(pos)
+            hermano = der if izq == hijo else izq
+            tam = tam_hijo + self.subtree_size(hermano) + 1
+            if tam_hijo > ALPHA * tam:
+                self.rebuild_subtree(pos)
+                return
+            hijo, tam_hijo = pos, tam
+
+    def subtree_size(self, pos):
+        tam = 0
+        pila = [pos]
+        while pila:
+            pos = pila.pop()
+            if pos != -1:
+                tam += 1
+                _, izq, der = self.get_links_at(pos)
+                pila.append(izq)
+                pila.append(der)
+        return tam
+
+    def rebuild_subtree(self, pos):
+        # reacomoda el subarbol con raiz en pos reutilizando sus mismos slots;
+        # la nueva raiz se queda en pos para no tocar al padre
+        orden = list(self.inorder_slots(pos))
+        k = len(orden)
+        raiz = k // 2
+        otros = iter(sorted(slot for slot, _ in orden if slot != pos))
+        slot_de = {-1: -1}
+        for i in range(k):
+            slot_de[i] = pos if i == raiz else next(otros)
+        for i, izq, der in arbol_balanceado(k):
+            nodo = orden[i][1]
+            self.write_node_at(nodo[:5] + (slot_de[izq], slot_de[der]), slot_de[i])
 
     def search(self, key):
         return self.search_pos(key, 0)
 
     def search_pos(self, key, pos):
-        with open(self.BST_Filename, "rb") as f:
-            f.seek(pos * RECORD_SIZE)
-            data = f.read(RECORD_SIZE)
-            if not data:
-                return None
-            id, nombre, cantidad, precio, fecha, izq, der = struct.unpack(FORMAT, data)
-            if key == id:
-                return Venta(id, nombre.decode().strip('\x00'), cantidad, precio, fecha.decode().strip('\x00'), izq, der)
-            elif key < id and izq != -1:
-                return self.search_pos(key, izq)
-            elif key > id and der != -1:
-                return self.search_pos(key, der)
+        if self.slots() == 0:
             return None
+        while pos != -1:
+            id, izq, der = self.get_links_at(pos)
+            if key == id:
+                return nodo_a_venta(self.get_node_at(pos))
+            pos = izq if key < id else der
+        return None
 
     def delete(self, key):
-        with open(self.BST_Filename, "rb+") as f:
-            while True:
-                pos = f.tell()
-                data = f.read(RECORD_SIZE)
-                if not data:
-                    break
-                id, nombre, cantidad, precio, fecha, izq, der = struct.unpack(FORMAT, data)
-                if id == key:
-                    f.seek(pos)
-                    to_write = struct.pack(FORMAT, -1, nombre, cantidad, precio, fecha, izq, der)
-                    f.write(to_write)
-                    return
+        if not self.delete_node(key):
+            return
+        if self.balanced and self.size() < ALPHA * self.max_size:
+            # demasiados borrados desde el ultimo rebuild: se rebalancea todo el arbol
+            self.bulk_load([])
+        elif self.compact_threshold is not None:
+            self.compact(self.compact_threshold)
+
+    def delete_node(self, key):
+        if self.slots() == 0:
+            return False
+        padre, pos = -1, 0
+        while pos != -1:
+            id, izq, der = self.get_links_at(pos)
+            if key == id:
+                break
+            padre = pos
+            pos = izq if key < id else der
+        if pos == -1:
+            return False
+
+        if izq != -1 and der != -1:
+            # dos hijos: se copia el sucesor (minimo del subarbol derecho) y se desenlaza
+            spadre, spos = pos, der
+            _, sizq, sder = self.get_links_at(spos)
+            while sizq != -1:
+                spadre, spos = spos, sizq
+                _, sizq, sder = self.get_links_at(spos)
+            sucesor = self.get_node_at(spos)
+            if spadre == pos:
+                der = sder
+            else:
+                p = self.get_node_at(spadre)
+                self.write_node_at(p[:5] + (sder, p[6]), spadre)
+            self.write_node_at(sucesor[:5] + (izq, der), pos)
+            self.free_node(spos)
+            return True
+
+        hijo = izq if izq != -1 else der
+        if padre == -1:
+            # la raiz siempre vive en el slot 0
+            if hijo == -1:
+                # era el unico nodo: todo lo demas son slots libres
+                if self.mm is not None:
+                    self.mm.close()
+                    self.mm = None
+                self.f.truncate(0)
+                self.cache.clear()
+                self.free_head, self.free_count, self.max_size = -1, 0, 0
+                self.write_meta()
+            else:
+                self.write_node_at(self.get_node_at(hijo), 0)
+                self.free_node(hijo)
+            return True
+
+        p = self.get_node_at(padre)
+        if p[5] == pos:
+            self.write_node_at(p[:5] + (hijo, p[6]), padre)
+        else:
+            self.write_node_at(p[:5] + (p[5], hijo), padre)
+        self.free_node(pos)
+        return True
 
     def search_rango(self, minimo, maximo):
+        # recorrido in-order guiado por el arbol: solo baja a los subarboles
+        # que pueden contener claves dentro de [minimo, maximo]. Una lapida vieja
+        # (id == -1) no se devuelve ni sirve para podar: se recorren sus dos hijos
         resultados = []
-        with open(self.BST_Filename, "rb") as f:
-            while True:
-                data = f.read(RECORD_SIZE)
-                if not data:
-                    break
-                id, nombre, cantidad, precio, fecha, izq, der = struct.unpack(FORMAT, data)
-                if id == -1:
-                    continue
-                if minimo <= id <= maximo:
-                    resultados.append(Venta(id, nombre.decode().strip('\x00'), cantidad, precio, fecha.decode().strip('\x00')))
+        if self.slots() == 0:
+            return resultados
+        pila = []
+        pos = 0
+        while pila or pos != -1:
+            while pos != -1:
+                id, izq, der = self.get_links_at(pos)
+                pila.append((pos, id, der))
+                pos = izq if id == -1 or minimo < id else -1
+            pos, id, der = pila.pop()
+            if id == -1:
+                pos = der
+                continue
+            if id > maximo:
+                break
+            if id >= minimo:
+                resultados.append(nodo_a_venta(self.get_node_at(pos)))
+            pos = der if id < maximo else -1
         return resultados
 
-    def print_file(self):
-        with open(self.BST_Filename, "rb") as f:
-            index = 0
-            while True:
-                data = f.read(RECORD_SIZE)
-                if not data:
-                    break
-                id, nombre, cantidad, precio, fecha, izq, der = struct.unpack(FORMAT, data)
+    def aggregate_range(self, minimo, maximo, ops=("count",)):
+        # misma poda que search_rango, pero sin armar Venta: solo (cantidad, precio)
+        def valores():
+            if self.slots() == 0:
+                return
+            pila = [0]
+            while pila:
+                id, izq, der, cantidad, precio = self.get_values_at(pila.pop())
                 if id == -1:
+                    pila.extend(hijo for hijo in (der, izq) if hijo != -1)
                     continue
-                venta = Venta(id, nombre.decode().strip('\x00'), cantidad, precio, fecha.decode().strip('\x00'), izq, der)
-                print(f"[{index}] ", end='')
-                venta.get()
-                index += 1
+                if minimo <= id <= maximo:
+                    yield cantidad, precio
+                if id < maximo and der != -1:
+                    pila.append(der)
+                if minimo < id and izq != -1:
+                    pila.append(izq)
 
-def main():
-    bst = BST_File("lab2_p1.dat")
+        return agregar(valores(), ops)
+
+    def inorder_slots(self, pos):
+        pila = []
+        while pila or pos != -1:
+            while pos != -1:
+                nodo = self.get_node_at(pos)
+                pila.append((pos, nodo))
+                pos = nodo[5]
+            pos, nodo = pila.pop()
+            yield pos, nodo
+            pos = nodo[6]
+
+    def inorder_nodes(self):
+        if self.slots() == 0:
+            return
+        for _, nodo in self.inorder_slots(0):
+            yield nodo
+
+    def bulk_load(self, registros, run_size=RUN_SIZE):
+        # ordena la entrada (por runs en disco si no entra en memoria), la mezcla con
+        # lo que ya tenga el arbol y reescribe todo como un arbol perfectamente balanceado;
+        # las lapidas viejas (id == -1) que siguen enlazadas no se copian, como en compact()
+        existentes = (nodo for nodo in self.inorder_nodes() if nodo[0] != -1)
+        self.rewrite((venta_a_nodo(registro) for registro in registros), existentes, run_size)
+
+    def dead_ratio(self):
+        slots = self.slots()
+        return self.free_count / slots if slots else 0.0
+
+    def compact(self, threshold=0.0, run_size=RUN_SIZE):
+        # reescribe solo los registros vivos en un archivo nuevo y balanceado; se recorre el
+        # archivo en orden fisico, asi tambien se limpian lapidas de versiones anteriores
+        if self.slots() == 0 or self.dead_ratio() < threshold:
+            return False
+        self.rewrite((nodo for nodo in self.raw_nodes() if nodo[0] != -1), iter(()), run_size)
+        return True
+
+    def rewrite(self, nuevos, existentes, run_size):
+        # nuevos: nodos en cualquier orden; existentes: nodos ya ordenados que ganan en empates
+        runs = []
+        buffer = []
+        for nodo in nuevos:
+            buffer.append(nodo)
+            if len(buffer) >= run_size:
+                buffer.sort(key=lambda nodo: nodo[0])
+                runs.append(escribir_run(buffer))
+                buffer = []
+        buffer.sort(key=lambda nodo: nodo[0])
+
+        # en empates heapq.merge respeta el orden de las fuentes: lo existente gana, como en insert
+        fuentes = [existentes] + [leer_run(f) for f in runs] + [iter(buffer)]
+        nodos = sin_duplicados(heapq.merge(*fuentes, key=lambda nodo: nodo[0]))
+
+        if runs:
+            ordenados = escribir_run(nodos)
+            n = ordenados.seek(0, os.SEEK_END) // RECORD_SIZE
+            ordenados.seek(0)
+            self.write_balanced(leer_run(ordenados), n)
+            ordenados.close()
+        else:
+            nodos = list(nodos)
+            self.write_balanced(nodos, len(nodos))
+        for f in runs:
+            f.close()
 
-    with open("sales_dataset.csv", newline='', encoding='utf-8') as csvfile:
+    def write_balanced(self, nodos, n):
+        # escritura secuencial en orden de claves: el registro i va al slot i, salvo que
+        # la mediana (raiz) va al slot 0 y el primer registro ocupa el slot de la mediana
+        raiz = n // 2
+        def slot(i):
+            if i == raiz:
+                return 0
+            if i == 0:
+                return raiz
+            return -1 if i == -1 else i
+
+        temp = self.BST_Filename + ".tmp"
+        with open(temp, "wb") as out:
+            if n > 0:
+                out.write(bytes(RECORD_SIZE))
+            primero = nodo_raiz = None
+            pendientes = []
+            for (i, izq, der), nodo in zip(arbol_balanceado(n), nodos):
+                nodo = nodo[:5] + (slot(izq), slot(der))
+                if i == raiz:
+                    nodo_raiz = nodo
+                    if i != 0:
+                        pendientes.append(primero)
+                elif i == 0:
+                    primero = nodo
+                else:
+                    pendientes.append(nodo)
+                if len(pendientes) >= BLOQUE:
+                    out.write(codificar(pendientes))
+                    pendientes = []
+            if pendientes:
+                out.write(codificar(pendientes))
+            if n > 0:
+                out.seek(0)
+                out.write(struct.pack(FORMAT, *nodo_raiz))
+
+        # la lista de libres se vacia antes del swap: si algo falla en el medio, a lo sumo
+        # se pierden slots libres pero nunca se reutiliza un slot vivo
+        self.free_head, self.free_count, self.max_size = -1, 0, n
+        self.write_meta()
+        self.meta_f.flush()
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        self.f.close()
+        os.replace(temp, self.BST_Filename)
+        self.f = open(self.BST_Filename, "rb+")
+        self.cache.clear()
+        self.remap()
+
+    def raw_nodes(self):
+        # todos los slots en orden fisico, incluidas las lapidas
+        if self.use_mmap:
+            if self.mm is not None:
+                for inicio in range(0, len(self.mm), BLOQUE * RECORD_SIZE):
+                    yield from decodificar(self.mm[inicio:inicio + BLOQUE * RECORD_SIZE])
+            return
+        self.f.seek(0)
+        yield from leer_run(self.f)
+
+    def print_file(self):
+        index = 0
+        for nodo in self.raw_nodes():
+            if nodo[0] == -1:
+                continue
+            venta = nodo_a_venta(nodo)
+            print(f"[{index}] ", end='')
+            venta.get()
+            index += 1
+
+def leer_csv(nombre_archivo):
+    with open(nombre_archivo, newline='', encoding='utf-8') as csvfile:
         reader = csv.reader(csvfile)
         next(reader)
         for row in reader:
@@ -149,7 +742,11 @@ def main():
             cantidad = int(row[2])
             precio = float(row[3])
             fecha = row[4]
-            bst.insert(Venta(id, nombre, cantidad, precio, fecha))
+            yield Venta(id, nombre, cantidad, precio, fecha)
+
+def main():
+    bst = BST_File("lab2_p1.dat")
+    bst.bulk_load(leer_csv("sales_dataset.csv"))
 
     a = bst.search(3)
     if a:
@@ -174,6 +771,7 @@ def main():
 
     print("\n--- todos los registros finales ---")
     bst.print_file()
+    bst.close()
 
 if __name__ == "__main__":
     main()
@@ -1,22 +1,91 @@
 import struct
 import os
 import pandas as pd
+import numpy as np
 import csv
 import time
 import matplotlib.pyplot as plt
 import math
+import bisect
+import heapq
+import tempfile
+import hashlib
+import itertools
+import re
+
+# tamaño de pagina usado para agrupar registros en el indice disperso
+PAGE_SIZE = 4096
+# buffer de lectura/escritura secuencial del rebuild
+REBUILD_BUFFER = 64 * PAGE_SIZE
+# registros del aux que se ordenan en memoria antes de volcar un run a disco
+RUN_SIZE = 100000
+# offsets dentro de un registro 'i30sif10si??' para trabajar sobre bytes sin decodificar
+NEXT_OFFSET = struct.calcsize('i30sif10si') - 4
+DELETED_OFFSET = struct.calcsize('i30sif10si')
+# cant y price van juntos ('if') a partir de este offset
+VALUES_OFFSET = struct.calcsize('i30si') - 4
+# el mismo layout que 'i30sif10si??' como dtype estructurado, para (de)codificar bloques enteros
+RECORD_DTYPE = np.dtype({
+    "names": ["id", "name", "cant", "price", "date", "next", "deleted", "aux"],
+    "formats": ["i4", "S30", "i4", "f4", "S10", "i4", "?", "?"],
+    "offsets": [0, 4, VALUES_OFFSET, VALUES_OFFSET + 4, struct.calcsize('i30sif'), NEXT_OFFSET, DELETED_OFFSET, DELETED_OFFSET + 1],
+    "itemsize": struct.calcsize('i30sif10si??'),
+})
+# mismo registro visto como bytes opacos: numpy no copia el relleno entre campos de un dtype
+# estructurado, asi que filtrar/ordenar/concatenar se hace sobre esta vista
+RAW_DTYPE = np.dtype((np.void, RECORD_DTYPE.itemsize))
+# registros por bloque al recorrer o escribir archivos completos
+BLOCK_RECORDS = REBUILD_BUFFER // RECORD_DTYPE.itemsize
+# campos que acepta aggregate_range (indice dentro de la tupla (cant, price))
+AGG_FIELDS = {"cantidad": 0, "cant": 0, "precio": 1, "price": 1}
+AGG_PATTERN = re.compile(r"(sum|min|max|avg)\((\w+)(?:\*(\w+))?\)")
+# filtro de Bloom: tasa de falsos positivos objetivo y capacidad minima
+BLOOM_FP_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+# cabecera de <filename>.bloom: num_bits, num_hashes, capacidad, claves agregadas y tamaños
+BLOOM_HEADER = "iiqqqq"
 
 class Record:
+    # name y date pueden quedar como los bytes leidos del archivo: se decodifican recien
+    # cuando alguien los lee, asi las busquedas que solo comparan claves no pagan el decode
+    __slots__ = ("id", "_name", "cant", "price", "_date", "next", "deleted", "aux")
+
     def __init__(self, id=-1, name="", cant=-1, price=-1, date="", deleted=False, next=-1, aux=False):
         self.id = id
-        self.name = name
+        self._name = name
         self.cant = cant
         self.price = price
-        self.date = date
+        self._date = date
         self.next = next
         self.deleted = deleted
         self.aux = aux
 
+    @property
+    def name(self):
+        if isinstance(self._name, bytes):
+            self._name = self._name.decode().strip()
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+
+    @property
+    def date(self):
+        if isinstance(self._date, bytes):
+            self._date = self._date.decode().strip()
+        return self._date
+
+    @date.setter
+    def date(self, value):
+        self._date = value
+
+    def name_bytes(self):
+        return self._name if isinstance(self._name, bytes) else self._name.encode()
+
+    def date_bytes(self):
+        return self._date if isinstance(self._date, bytes) else self._date.encode()
+
     def __str__(self):
         return f'{self.id} | {self.name} | {self.cant} | {self.price} | {self.date} | next: {self.next} | aux: {self.aux}'
 
@@ -33,10 +102,10 @@ class Record:
         format_str = 'i30sif10si??'
         packed = struct.pack(format_str, 
                             self.id,
-                            self.name.encode().ljust(30, b'\x00'),
+                            self.name_bytes().ljust(30, b'\x00'),
                             self.cant, 
                             self.price,
-                            self.date.encode().ljust(10, b'\x00'),
+                            self.date_bytes().ljust(10, b'\x00'),
                             self.next, 
                             self.deleted,
                             self.aux)
@@ -46,347 +115,802 @@ class Record:
     def from_binary(data):
         #try:
         id, name, cant, price, date, next, deleted, aux = struct.unpack('i30sif10si??', data)
-        return Record(id, name.decode().strip(), cant, price, date.decode().strip(), deleted, next, aux)
+        return Record(id, name, cant, price, date, deleted, next, aux)
         # except struct.error as e:
         #     print(f"Error al desempaquetar: {e}")
         #     print(f"Datos recibidos: {data}, longitud: {len(data)}")
         #     return None
 
+def raw_key(data):
+    return struct.unpack_from("i", data)[0]
+
+def encode_records(records):
+    block = np.zeros(len(records), dtype=RECORD_DTYPE)
+    block["id"] = [record.id for record in records]
+    block["name"] = [record.name_bytes() for record in records]
+    block["cant"] = [record.cant for record in records]
+    block["price"] = [record.price for record in records]
+    block["date"] = [record.date_bytes() for record in records]
+    block["next"] = [record.next for record in records]
+    block["deleted"] = [record.deleted for record in records]
+    block["aux"] = [record.aux for record in records]
+    return block
+
+def split_records(block):
+    # bloque -> lista de registros crudos (para heapq.merge)
+    data = block.tobytes()
+    size = RECORD_DTYPE.itemsize
+    return [data[offset:offset + size] for offset in range(0, len(data), size)]
+
+def read_blocks(f):
+    while True:
+        data = f.read(BLOCK_RECORDS * RECORD_DTYPE.itemsize)
+        count = len(data) // RECORD_DTYPE.itemsize
+        if count == 0:
+            break
+        yield np.frombuffer(data, dtype=RECORD_DTYPE, count=count)
+
+def write_run(data):
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    f.seek(0)
+    return f
+
+def take(block, index):
+    return block.view(RAW_DTYPE)[index].view(RECORD_DTYPE)
+
+def join_blocks(blocks):
+    if not blocks:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.concatenate([block.view(RAW_DTYPE) for block in blocks]).view(RECORD_DTYPE)
+
+def sort_by_key(block):
+    return take(block, np.argsort(block["id"], kind="stable"))
+
+def sort_runs(blocks):
+    # ordena bloques de registros por clave en runs de ~RUN_SIZE; los runs completos van a disco
+    runs = []
+    pending = []
+    count = 0
+    for block in blocks:
+        pending.append(block)
+        count += len(block)
+        if count >= RUN_SIZE:
+            runs.append(write_run(sort_by_key(join_blocks(pending)).tobytes()))
+            pending = []
+            count = 0
+    buffer = sort_by_key(join_blocks(pending))
+    return runs, split_records(buffer)
+
+def write_chain_block(f, records, n, bloom):
+    # escribe un bloque del nuevo principal: cada registro apunta al slot siguiente
+    block = np.frombuffer(bytearray(b"".join(records)), dtype=RECORD_DTYPE)
+    block["next"] = np.arange(n + 1, n + 1 + len(block))
+    block["deleted"] = False
+    block["aux"] = False
+    for key in block["id"].tolist():
+        bloom.add(key)
+    f.write(block.tobytes())
+    return n + len(block)
+
+def read_run(f, record_size):
+    while True:
+        block = f.read(REBUILD_BUFFER // record_size * record_size)
+        if not block:
+            break
+        for offset in range(0, len(block) - record_size + 1, record_size):
+            yield block[offset:offset + record_size]
+
+def without_duplicates(records):
+    # la entrada viene ordenada por clave; se queda con la primera aparicion de cada una
+    last = None
+    for data in records:
+        key = raw_key(data)
+        if key != last:
+            last = key
+            yield data
+
+def parse_aggregates(ops):
+    # "count", "sum(cantidad)", "sum(cantidad*precio)", "min(precio)", "max(precio)", "avg(...)"
+    plan = []
+    for op in ops:
+        expr = op.replace(" ", "")
+        if expr == "count":
+            plan.append(("count", ()))
+            continue
+        match = AGG_PATTERN.fullmatch(expr)
+        names = [name for name in match.groups()[1:] if name is not None] if match else []
+        if not match or any(name not in AGG_FIELDS for name in names):
+            raise ValueError(f"unsupported aggregate: {op}")
+        plan.append((match.group(1), tuple(AGG_FIELDS[name] for name in names)))
+    return plan
+
+def aggregate(values, ops):
+    # values: tuplas (cant, price) leidas directo de los bytes; devuelve {op: resultado}
+    plan = parse_aggregates(ops)
+    count = 0
+    acc = [None] * len(plan)
+    for row in values:
+        count += 1
+        for i, (kind, fields) in enumerate(plan):
+            if kind == "count":
+                continue
+            value = row[fields[0]] if len(fields) == 1 else row[fields[0]] * row[fields[1]]
+            current = acc[i]
+            if current is None:
+                acc[i] = value
+            elif kind in ("sum", "avg"):
+                acc[i] = current + value
+            elif (value < current) if kind == "min" else (value > current):
+                acc[i] = value
+
+    result = {}
+    for op, (kind, _), value in zip(ops, plan, acc):
+        if kind == "count":
+            result[op] = count
+        elif kind == "sum":
+            result[op] = value if value is not None else 0
+        elif kind == "avg":
+            result[op] = value / count if count else None
+        else:
+            result[op] = value
+    return result
+
+class BloomFilter:
+    def __init__(self, num_bits, num_hashes, bits=None, capacity=0, count=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+        # capacidad de diseño y claves agregadas: pasada la capacidad la tasa de falsos
+        # positivos supera fp_rate y hay que regenerar el filtro mas grande
+        self.capacity = capacity
+        self.count = count
+
+    @staticmethod
+    def for_capacity(n, fp_rate=BLOOM_FP_RATE):
+        n = max(n, BLOOM_MIN_CAPACITY)
+        num_bits = int(-n * math.log(fp_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(num_bits / n * math.log(2)))
+        return BloomFilter(num_bits, num_hashes, capacity=n)
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def positions(self, key):
+        # doble hashing sobre un hash de 64 bits de la clave
+        h1, h2 = struct.unpack("II", hashlib.blake2b(struct.pack("i", key), digest_size=8).digest())
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key):
+        self.count += 1
+        for p in self.positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(key))
+
+class RebuildStats:
+    def __init__(self):
+        self.rebuilds = 0
+        self.rebuild_time = 0.0
+        self.last_rebuild_time = 0.0
+        # desde el ultimo rebuild: busquedas y registros recorridos en la cadena
+        self.lookups = 0
+        self.chain_steps = 0
+
+    def avg_chain(self):
+        return self.chain_steps / self.lookups if self.lookups else 0.0
+
+    def __str__(self):
+        return f'rebuilds: {self.rebuilds} | tiempo total: {self.rebuild_time:.4f}s | ultimo: {self.last_rebuild_time:.4f}s | cadena promedio: {self.avg_chain():.2f}'
+
+# Politicas de rebuild: should_rebuild(seq) se evalua despues de cada insercion en el aux
+
+class LogRebuildPolicy:
+    # regla original: el aux pasa de log(n) registros
+    def should_rebuild(self, seq):
+        return seq.count_aux() - 1 > math.log(seq.count_main())
+
+class AuxRatioRebuildPolicy:
+    def __init__(self, ratio=0.1):
+        self.ratio = ratio
+
+    def should_rebuild(self, seq):
+        return seq.count_aux() > self.ratio * seq.count_main()
+
+class AuxSizeRebuildPolicy:
+    def __init__(self, max_aux=1000):
+        self.max_aux = max_aux
+
+    def should_rebuild(self, seq):
+        return seq.count_aux() >= self.max_aux
+
+class ChainWalkRebuildPolicy:
+    # usa el largo medio de cadena medido en las busquedas desde el ultimo rebuild
+    def __init__(self, max_avg_chain=4.0, min_lookups=32):
+        self.max_avg_chain = max_avg_chain
+        self.min_lookups = min_lookups
+
+    def should_rebuild(self, seq):
+        stats = seq.rebuild_stats
+        return stats.lookups >= self.min_lookups and stats.avg_chain() > self.max_avg_chain
+
+class CostRebuildPolicy:
+    # cada paso de cadena es una lectura aleatoria; el rebuild lee y escribe ambos archivos
+    # de forma secuencial. Se reconstruye cuando lo ya pagado en saltos alcanza ese costo.
+    def __init__(self, random_read_cost=1.0, seq_page_cost=0.1):
+        self.random_read_cost = random_read_cost
+        self.seq_page_cost = seq_page_cost
+
+    def should_rebuild(self, seq):
+        pages = (seq.count_main() + seq.count_aux()) * seq.RECORD_SIZE / PAGE_SIZE
+        rebuild_cost = 2 * pages * self.seq_page_cost
+        return seq.rebuild_stats.chain_steps * self.random_read_cost >= rebuild_cost
+
+class SequentialCursor:
+    # cursor entre dos registros de la cadena mezclada con la memtable: next() devuelve el
+    # de la derecha y avanza, prev() el de la izquierda y retrocede. Guarda el registro de
+    # la cadena a la derecha (None = al final) y cuantos registros de la memtable quedan a
+    # la izquierda; se invalida si el archivo o la memtable cambian (insert, delete, rebuild)
+    def __init__(self, seq):
+        self.seq = seq
+        self.current = None
+        self.index = 0
+
+    def seek(self, key):
+        # se ubica antes del primer registro vivo con clave >= key
+        record = self.seq.find_prev(key)[5]
+        # find_prev puede devolver un registro borrado con clave mayor (defer_delete)
+        if record is not None and record.deleted:
+            record = self.seq.next_live(record)
+        self.current = record
+        self.index = bisect.bisect_left(self.seq.memtable_keys, key)
+        return self
+
+    def next(self):
+        # en empates sale primero el de la cadena (y prev() devuelve antes el de la memtable)
+        record = self.current
+        memtable = self.seq.memtable
+        if self.index < len(memtable) and (record is None or memtable[self.index].key() < record.key()):
+            record = memtable[self.index]
+            self.index += 1
+            return record
+        if record is None:
+            return None
+        self.current = self.seq.next_live(record)
+        return record
+
+    def prev(self):
+        key = self.current.key() if self.current is not None else float("inf")
+        record = self.seq.live_before(key)
+        memtable = self.seq.memtable
+        if self.index > 0 and (record is None or memtable[self.index - 1].key() >= record.key()):
+            self.index -= 1
+            return memtable[self.index]
+        if record is None:
+            return None
+        self.current = record
+        return record
+
+    def __iter__(self):
+        record = self.next()
+        while record is not None:
+            yield record
+            record = self.next()
+
+
 class Sequential:
-    def __init__(self, filename):
+    def __init__(self, filename, memtable_size=0, rebuild_policy=None, defer_delete=False):
         self.filename = filename
+        # defer_delete: delete solo marca el registro; el rebuild se encarga de sacarlo de la cadena
+        self.defer_delete = defer_delete
+        self.rebuild_policy = rebuild_policy if rebuild_policy is not None else LogRebuildPolicy()
+        self.rebuild_stats = RebuildStats()
         self.aux_filename = "aux.bin"
         self.HEADER_SIZE = 5  
 
         if not os.path.exists(self.filename):
             with open(self.filename, 'wb') as f:
                 f.write(struct.pack("i?", -1, False)) 
+            # aux.bin no depende de filename: lo que quede de un archivo anterior no es de este
+            open(self.aux_filename, 'wb').close()
+        if not os.path.exists(self.aux_filename):
+            open(self.aux_filename, 'wb').close()
 
         self.RECORD_SIZE = struct.calcsize('i30sif10si??')
         print(f"Tamaño de registro calculado: {self.RECORD_SIZE} bytes")
 
+        # indice disperso: clave del primer registro de cada pagina del archivo principal
+        self.SPARSE_STEP = max(1, PAGE_SIZE // self.RECORD_SIZE)
+        self.open_files()
+
+        # filtro de Bloom sobre las claves del principal y el aux, para cortar busquedas de
+        # claves inexistentes; se guarda en <filename>.bloom junto al tamaño de ambos archivos
+        self.bloom_filename = self.filename + ".bloom"
+        self.load_bloom()
+
+        # buffer ordenado en memoria delante del aux (0 = desactivado); se vuelca
+        # al archivo principal con un merge cuando llega a memtable_size registros
+        self.memtable_size = memtable_size
+        self.memtable_keys = []
+        self.memtable = []
+
+    def open_files(self):
+        # handles abiertos mientras viva el objeto (se reabren despues de rebuild)
+        self.main_f = open(self.filename, "r+b")
+        self.aux_f = open(self.aux_filename, "r+b")
+        self.build_sparse_index()
+
+    def close(self):
+        if self.main_f is not None:
+            self.flush_memtable()
+            self.save_bloom()
+        self.close_files()
+
+    def load_bloom(self):
+        # si los archivos cambiaron desde que se guardo (p. ej. no se llamo a close) se regenera
+        # (o si ya llego a su capacidad)
+        if os.path.exists(self.bloom_filename):
+            with open(self.bloom_filename, "rb") as f:
+                header = f.read(struct.calcsize(BLOOM_HEADER))
+                if len(header) == struct.calcsize(BLOOM_HEADER):
+                    num_bits, num_hashes, capacity, count, main_size, aux_size = struct.unpack(BLOOM_HEADER, header)
+                    if (main_size, aux_size) == self.file_sizes() and count < capacity:
+                        self.bloom = BloomFilter(num_bits, num_hashes, bytearray(f.read()), capacity, count)
+                        return
+        self.regenerate_bloom()
+
+    def regenerate_bloom(self):
+        # capacidad para el doble de registros actuales: el filtro crece de forma amortizada
+        self.bloom = BloomFilter.for_capacity(2 * (self.count_main() + self.count_aux()))
+        for aux in (False, True):
+            for block in self.live_blocks(aux):
+                for key in block["id"].tolist():
+                    self.bloom.add(key)
+
+    def save_bloom(self):
+        with open(self.bloom_filename, "wb") as f:
+            f.write(struct.pack(BLOOM_HEADER, self.bloom.num_bits, self.bloom.num_hashes,
+                                self.bloom.capacity, self.bloom.count, *self.file_sizes()))
+            f.write(self.bloom.bits)
+
+    def file_sizes(self):
+        self.main_f.seek(0, 2)
+        self.aux_f.seek(0, 2)
+        return self.main_f.tell(), self.aux_f.tell()
+
+    def close_files(self):
+        if self.main_f is not None:
+            self.main_f.close()
+            self.aux_f.close()
+            self.main_f = self.aux_f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get_file(self, aux):
+        return self.aux_f if aux else self.main_f
+
+    def count_main(self):
+        self.main_f.seek(0, 2)
+        return (self.main_f.tell() - self.HEADER_SIZE) // self.RECORD_SIZE
+
+    def count_aux(self):
+        self.aux_f.seek(0, 2)
+        return self.aux_f.tell() // self.RECORD_SIZE
+
+    def build_sparse_index(self):
+        self.fences = []
+        for pos in range(0, self.count_main(), self.SPARSE_STEP):
+            self.main_f.seek(self.HEADER_SIZE + pos * self.RECORD_SIZE)
+            self.fences.append(struct.unpack("i", self.main_f.read(4))[0])
+
+    def update_sparse_index(self, pos, key):
+        if pos % self.SPARSE_STEP == 0:
+            i = pos // self.SPARSE_STEP
+            if i < len(self.fences):
+                self.fences[i] = key
+            else:
+                self.fences.append(key)
+
     def write_start(self, start_pos, aux):
-        with open(self.filename, 'r+b') as f:
-            f.write(struct.pack("i?", start_pos, aux))
+        self.main_f.seek(0)
+        self.main_f.write(struct.pack("i?", start_pos, aux))
 
     def get_start(self):
-        with open(self.filename, 'rb') as f:
-            data = f.read(5)
-            if len(data) < 5:
-                return -1, False
-            return struct.unpack("i?", data)
+        self.main_f.seek(0)
+        data = self.main_f.read(5)
+        if len(data) < 5:
+            return -1, False
+        return struct.unpack("i?", data)
+
+    def get_raw_at(self, aux, pos):
+        if pos < 0:
+            return None
+        f = self.get_file(aux)
+        offset = self.HEADER_SIZE + pos * self.RECORD_SIZE if not aux else pos * self.RECORD_SIZE
+        f.seek(offset)
+        data = f.read(self.RECORD_SIZE)
+        if len(data) < self.RECORD_SIZE:
+            return None
+        return data
 
     def get_record_at(self, aux, pos):
-        filename = self.aux_filename if aux else self.filename
-        try:
-            with open(filename, "rb") as f:
-                offset = self.HEADER_SIZE + pos * self.RECORD_SIZE if not aux else pos * self.RECORD_SIZE
-                f.seek(offset)
-                data = f.read(self.RECORD_SIZE)
-                if len(data) < self.RECORD_SIZE:
-                    return None
-                return Record.from_binary(data)
-        except FileNotFoundError:
+        data = self.get_raw_at(aux, pos)
+        if data is None:
             return None
+        return Record.from_binary(data)
 
     def write_record_end(self, aux, record):
-        filename = self.aux_filename if aux else self.filename
-        with open(filename, "ab") as f:
-            pos = (f.tell() - (5 if not aux else 0)) // self.RECORD_SIZE
-            f.write(record.to_binary())
-            return pos
+        f = self.get_file(aux)
+        f.seek(0, 2)
+        pos = (f.tell() - (5 if not aux else 0)) // self.RECORD_SIZE
+        f.write(record.to_binary())
+        if not aux:
+            self.update_sparse_index(pos, record.key())
+        return pos
 
     def write_record_at(self, record, pos, aux):
-        filename = self.aux_filename if aux else self.filename
-        with open(filename, "r+b") as f:
-            offset = 5 + pos * self.RECORD_SIZE if not aux else pos * self.RECORD_SIZE
-            f.seek(offset)
-            f.write(record.to_binary())
+        f = self.get_file(aux)
+        offset = 5 + pos * self.RECORD_SIZE if not aux else pos * self.RECORD_SIZE
+        f.seek(offset)
+        f.write(record.to_binary())
+        if not aux:
+            self.update_sparse_index(pos, record.key())
 
     def binary_search(self, key):
-        with open(self.filename, "rb") as f:
-            f.seek(0, 2)
-            file_size = f.tell()
-            if file_size <= self.HEADER_SIZE:
-                return -1
-            num_records = (file_size - self.HEADER_SIZE) // self.RECORD_SIZE
-
-        left, right = 0, num_records - 1
-        result = -1
+        # ultima posicion del archivo principal con clave < key: el indice disperso
+        # elige la pagina y la busqueda binaria se hace sobre esa pagina ya leida
+        num_records = self.count_main()
+        if num_records <= 0:
+            return -1
+
+        block = bisect.bisect_left(self.fences, key) - 1
+        if block < 0:
+            return -1
+        first = block * self.SPARSE_STEP
+        count = min(self.SPARSE_STEP, num_records - first)
+        self.main_f.seek(self.HEADER_SIZE + first * self.RECORD_SIZE)
+        data = self.main_f.read(count * self.RECORD_SIZE)
+
+        left, right = 0, count - 1
+        result = 0
 
         while left <= right:
             mid = (left + right) // 2
-            record = self.get_record_at(False, mid)
-            if record is None:
-                break
-
-            if record.key() < key:
+            if struct.unpack_from("i", data, mid * self.RECORD_SIZE)[0] < key:
                 result = mid
                 left = mid + 1
             else:
                 right = mid - 1
 
-        return result
+        return first + result
 
     def print_all(self):
         print("\nContenido del archivo principal:")
         start_pos, start_aux = self.get_start()
         print(f"Encabezado (start position): {start_pos}{'a' if start_aux else 'd'}")
 
-        with open(self.filename, "rb") as f:
-            f.seek(5) 
-            pos = 0
-            while True:
-                data = f.read(self.RECORD_SIZE)
-                if not data or len(data) < self.RECORD_SIZE:
-                    break
-                record = Record.from_binary(data)
-                if record:
-                    next_ptr = f"{record.next}{'a' if record.aux else 'd'}" if record.next != -1 else "-1"
-                    deleted_flag = "[DELETED] " if record.deleted else ""
-                    print(f"Pos {pos}d: {deleted_flag}{record.id} | {record.name} | {record.cant} | {record.price} | {record.date} | next: {next_ptr}")
-                pos += 1
+        self.main_f.seek(self.HEADER_SIZE)
+        self.print_blocks(self.main_f, 'd')
 
         print("\nContenido del archivo auxiliar:")
-        try:
-            with open(self.aux_filename, "rb") as f:
-                pos = 0
-                while True:
-                    data = f.read(self.RECORD_SIZE)
-                    if not data or len(data) < self.RECORD_SIZE:
-                        break
-                    record = Record.from_binary(data)
-                    if record:
-                        next_ptr = f"{record.next}{'a' if record.aux else 'd'}" if record.next != -1 else "-1"
-                        deleted_flag = "[DELETED] " if record.deleted else ""
-                        print(f"Pos {pos}a: {deleted_flag}{record.id} | {record.name} | {record.cant} | {record.price} | {record.date} | next: {next_ptr}")
-                    pos += 1
-        except FileNotFoundError:
-            print("No existe archivo auxiliar")
+        self.aux_f.seek(0)
+        self.print_blocks(self.aux_f, 'a')
+
+        if self.memtable:
+            print("\nContenido del buffer en memoria:")
+            for record in self.memtable:
+                print(f"{record.id} | {record.name} | {record.cant} | {record.price} | {record.date}")
+
+    def print_blocks(self, f, tag):
+        pos = 0
+        for block in read_blocks(f):
+            for id, name, cant, price, date, next, deleted, aux in block.tolist():
+                next_ptr = f"{next}{'a' if aux else 'd'}" if next != -1 else "-1"
+                deleted_flag = "[DELETED] " if deleted else ""
+                print(f"Pos {pos}{tag}: {deleted_flag}{id} | {name.decode()} | {cant} | {price} | {date.decode()} | next: {next_ptr}")
+                pos += 1
 
     def insert(self, record):
+        if self.memtable_size > 0:
+            # como en el archivo, una clave que ya esta viva (en la memtable o en disco) se rechaza
+            if self.search(record.key()) is not None:
+                return
+            i = bisect.bisect_right(self.memtable_keys, record.key())
+            self.memtable_keys.insert(i, record.key())
+            self.memtable.insert(i, record)
+            if len(self.memtable) >= self.memtable_size:
+                self.flush_memtable()
+            return
+
+        # el filtro se regenera antes de agregar la clave: todavia no esta en los archivos
+        if self.bloom.is_full():
+            self.regenerate_bloom()
+        self.bloom.add(record.key())
+
         # Check if main file is empty (only has header)
-        with open(self.filename, "rb") as f:
-            f.seek(0, 2)
-            file_size = f.tell()
+        self.main_f.seek(0, 2)
+        file_size = self.main_f.tell()
 
         if file_size <= self.HEADER_SIZE:  # Only has header
             self.write_start(0, False)  # First record at position 0 in main file
             self.write_record_at(record, 0, False)
             return
 
-        # Find insertion position using binary search
-        pos = self.binary_search(record.key())
-        start_pos, start_aux = self.get_start()
-
-        # Case 1: Insert at beginning (new smallest key)
-        if pos == -1:
-            prev = self.get_record_at(start_aux, start_pos)
-            if prev.next == -1:
-                new_pos = self.write_record_end(True, record)
-                record.next = start_pos
-                record.aux = start_aux
-                # Update the record in AUX file with proper links
-                self.write_record_at(record, new_pos, True)
-                # Update header to point to new record in AUX file
-                self.write_start(new_pos, True)
-            else:
-                temp = self.get_record_at(prev.aux, prev.next)
-                prev_pos, prev_aux = start_pos, start_aux
-
-                first = True
-                if start_aux != False:
-                    while temp.next != -1 or temp.is_smaller(record.id):
-                        prev_pos, prev_aux = prev.next, prev.aux
-                        first = False
-                        prev = self.get_record_at(prev.aux, prev.next)
-                        temp = self.get_record_at(temp.aux, temp.next)
-
-                if first:
-                    new_pos = self.write_record_end(True, record)
-                    record.next = start_pos
-                    record.aux = start_aux
-                    # Update the record in AUX file with proper links
-                    self.write_record_at(record, new_pos, True)
-                    # Update header to point to new record in AUX file
-                    self.write_start(new_pos, True)
-                else:
-                    record.next, record.aux = prev.next, prev.aux
-                    new_pos = self.write_record_end(True, record)
-                    prev.next, prev.aux = new_pos, True
-
-                self.write_record_at(prev, prev_pos, prev_aux)
+        # predecesor en la cadena: ultimo registro con clave < key (None = encabezado)
+        prev_pos, prev_aux, prev, _, _, current = self.find_prev(record.key())
+        if current is not None and current.key() == record.key():
             return
 
-        # Get the record at found position
-        current = self.get_record_at(False, pos)
-        if current is None:
-            return
-
-        # Case 2: Insert at end of list
-        if current.next == -1:
-            if record.key() > current.key():
-                new_pos = self.write_record_end(False, record)
-                current.next = new_pos
-                current.aux = False
-                self.write_record_at(current, pos, False)
+        # Case 1: Insert at beginning (new smallest key)
+        if prev is None:
+            record.next, record.aux = self.get_start()
+            new_pos = self.write_record_end(True, record)
+            # Update header to point to new record in AUX file
+            self.write_start(new_pos, True)
+
+        # Case 2: Insert at end of list (the tail is the last record of the main file)
+        elif prev.next == -1 and not prev_aux and prev_pos == self.count_main() - 1:
+            new_pos = self.write_record_end(False, record)
+            prev.next = new_pos
+            prev.aux = False
+            self.write_record_at(prev, prev_pos, False)
             return
 
-        # Case 3: Insert in middle of list
-        next_record = self.get_record_at(current.aux, current.next)
-        if next_record and record.key() > current.key() and record.key() < next_record.key():
-            # Insert between current and next (in AUX file)
-            record.next = current.next
-            record.aux = current.aux
-            new_pos = self.write_record_end(True, record)
-            current.next = new_pos
-            current.aux = True
-            self.write_record_at(current, pos, False)
+        # Case 3: Insert in middle of list (in AUX file)
         else:
-            # Need to find correct position in chain
-            prev_record = current
-            prev_pos = pos
-            prev_aux = False
-            next_pos = current.next
-            next_aux = current.aux
-
-            while next_pos != -1:
-                next_record = self.get_record_at(next_aux, next_pos)
-                if not next_record or record.key() < next_record.key():
-                    break
-                prev_record = next_record
-                prev_pos = next_pos
-                prev_aux = next_aux
-                next_pos = next_record.next
-                next_aux = next_record.aux
-
-            # Insert between prev_record and next_record (in AUX file)
-            record.next = prev_record.next
-            record.aux = prev_record.aux
+            record.next = prev.next
+            record.aux = prev.aux
             new_pos = self.write_record_end(True, record)
-            prev_record.next = new_pos
-            prev_record.aux = True
-            self.write_record_at(prev_record, prev_pos, prev_aux)
+            prev.next = new_pos
+            prev.aux = True
+            self.write_record_at(prev, prev_pos, prev_aux)
+
+        self.maybe_rebuild()
 
-        n = self.get_end(False)
-        if new_pos > math.log(n):
+    def maybe_rebuild(self):
+        if self.rebuild_policy.should_rebuild(self):
             self.rebuild()
 
-    def get_end(self, aux):
-        if aux:
-            with open(self.aux_filename, "ab+") as f:
-                f.seek(0, 2)  # Move the pointer to the end of the file
-                end = (f.tell()-self.HEADER_SIZE) // self.RECORD_SIZE  # Calculate the number of records in the file
-            return end
-        else:
-            with open(self.filename, "ab+") as f:
-                f.seek(0, 2)  # Move the pointer to the end of the file
-                end = (f.tell()-self.HEADER_SIZE) // self.RECORD_SIZE  # Calculate the number of records in the file
-            return end
-            
-    def rebuild(self):
-        print("\nIniciando proceso de reconstrucción...")
+    def live_blocks(self, aux):
+        # registros no borrados en orden fisico, decodificados por bloques grandes
+        f = self.get_file(aux)
+        f.seek(0 if aux else self.HEADER_SIZE)
+        for block in read_blocks(f):
+            yield take(block, ~block["deleted"])
 
-        ordered_records = []
-        pos, aux = self.get_start()
+    def sorted_aux_runs(self):
+        # el aux no esta ordenado: se ordena por runs acotados en memoria
+        return sort_runs(self.live_blocks(True))
 
-        while pos != -1:
-            record = self.get_record_at(aux, pos)
-            if record is None:
-                break
-            if not record.deleted:
-                ordered_records.append(record)
-            pos = record.next
-            aux = record.aux
+    def flush_memtable(self):
+        if not self.memtable:
+            return
+        records = self.memtable
+        self.memtable_keys, self.memtable = [], []
+        self.rebuild(split_records(encode_records(records)), len(records))
+
+    def insert_many(self, records):
+        # ordena el lote (por runs si no entra en memoria) y lo mezcla con el principal y el
+        # aux en una sola pasada secuencial, en vez de un insert por registro
+        pending = self.memtable
+        self.memtable_keys, self.memtable = [], []
+        items = itertools.chain(pending, records)
+        chunks = iter(lambda: list(itertools.islice(items, BLOCK_RECORDS)), [])
+        runs, buffer = sort_runs(encode_records(chunk) for chunk in chunks)
+        count = len(runs) * RUN_SIZE + len(buffer)
+        if count > 0:
+            batch = heapq.merge(*[read_run(f, self.RECORD_SIZE) for f in runs], iter(buffer), key=raw_key)
+            self.rebuild(batch, count)
+        for f in runs:
+            f.close()
+
+    def find_in_memtable(self, key):
+        i = bisect.bisect_left(self.memtable_keys, key)
+        if i < len(self.memtable_keys) and self.memtable_keys[i] == key:
+            return i
+        return -1
+
+    def rebuild(self, extra=(), extra_count=0):
+        # extra: registros crudos ya ordenados (memtable, insert_many) que entran en el mismo merge
+        print("\nIniciando proceso de reconstrucción...")
+        t1 = time.time()
+
+        # merge en una sola pasada del principal (ya ordenado) con el aux ordenado
+        runs, buffer = self.sorted_aux_runs()
+        main_records = (data for block in self.live_blocks(False) for data in split_records(block))
+        sources = [main_records] + [read_run(f, self.RECORD_SIZE) for f in runs] + [iter(buffer)]
+        sources.append(extra)
 
         temp_main = "temp_main.bin"
         temp_aux = "temp_aux.bin"
 
         # Write records to new main file
-        with open(temp_main, 'wb') as f_main:
+        with open(temp_main, 'wb', buffering=REBUILD_BUFFER) as f_main:
             # Write header (will be updated later)
             f_main.write(struct.pack("i?", 0, False))
 
-            # Write records sequentially
-            for i, record in enumerate(ordered_records):
-                record.next = i+1
-                if record.next == len(ordered_records):
-                    record.next = -1
-                record.aux = False
-                f_main.write(record.to_binary())
+            # Write records sequentially, each one pointing to the next slot
+            # (el filtro de Bloom se arma en la misma pasada, con lugar para crecer)
+            bloom = BloomFilter.for_capacity(2 * (self.count_main() + self.count_aux() + extra_count))
+            n = 0
+            pending = []
+            # heapq.merge respeta el orden de las fuentes en empates: lo que ya esta en
+            # los archivos gana sobre extra y dentro del lote gana la primera aparicion
+            for data in without_duplicates(heapq.merge(*sources, key=raw_key)):
+                pending.append(data)
+                if len(pending) >= BLOCK_RECORDS:
+                    n = write_chain_block(f_main, pending, n, bloom)
+                    pending = []
+            n = write_chain_block(f_main, pending, n, bloom)
+
+            if n > 0:
+                f_main.seek(self.HEADER_SIZE + (n - 1) * self.RECORD_SIZE + NEXT_OFFSET)
+                f_main.write(struct.pack("i", -1))
+            else:
+                f_main.seek(0)
+                f_main.write(struct.pack("i?", -1, False))
+
+        for f in runs:
+            f.close()
 
         # Clear auxiliary file
         open(temp_aux, 'wb').close()
+        self.close_files()
         os.replace(temp_main, self.filename)
         os.replace(temp_aux, self.aux_filename)
+        self.open_files()
+        self.bloom = bloom
+        self.save_bloom()
+
+        stats = self.rebuild_stats
+        stats.last_rebuild_time = time.time() - t1
+        stats.rebuild_time += stats.last_rebuild_time
+        stats.rebuilds += 1
+        stats.lookups = 0
+        stats.chain_steps = 0
 
     def search(self, key):
+        i = self.find_in_memtable(key)
+        if i != -1:
+            return self.memtable[i]
+        if key not in self.bloom:
+            return None
+
+        record = self.find_prev(key)[5]
+        if record is not None and record.id == key:
+            return record
+        return None
+
+    def find_prev(self, key):
+        # busqueda binaria en el principal y despues caminata local por la cadena.
+        # Devuelve (prev_pos, prev_aux, prev, pos, aux, record): record es el primer registro
+        # vivo con clave >= key y prev el registro enlazado justo antes (None = encabezado)
         pos = self.binary_search(key)
+        while pos != -1:
+            # un registro borrado del principal puede estar fuera de la cadena
+            record = self.get_record_at(False, pos)
+            if not record.deleted:
+                break
+            pos -= 1
+
         if pos == -1:
-            pos = self.get_start()
-            if pos == -1:
-                return None
-            record = self.get_record_at(pos[1], pos[0])
+            prev_pos, prev_aux, prev = -1, False, None
+            cur_pos, cur_aux = self.get_start()
         else:
-            record = self.get_record_at(False, pos)
+            prev_pos, prev_aux, prev = pos, False, record
+            cur_pos, cur_aux = record.next, record.aux
 
-        while record:
-            if not record.deleted and record.id == key:
-                return record
-            if record.next == -1:
+        self.rebuild_stats.lookups += 1
+        while cur_pos != -1:
+            record = self.get_record_at(cur_aux, cur_pos)
+            self.rebuild_stats.chain_steps += 1
+            if record is None:
                 break
-            record = self.get_record_at(record.aux, record.next)
+            if record.key() > key or (record.key() == key and not record.deleted):
+                return prev_pos, prev_aux, prev, cur_pos, cur_aux, record
+            prev_pos, prev_aux, prev = cur_pos, cur_aux, record
+            cur_pos, cur_aux = record.next, record.aux
 
+        return prev_pos, prev_aux, prev, -1, False, None
+
+    def next_live(self, record):
+        # siguiente registro vivo de la cadena despues de record
+        while record.next != -1:
+            record = self.get_record_at(record.aux, record.next)
+            if record is None:
+                return None
+            if not record.deleted:
+                return record
         return None
 
-    def search_range(self, mini, maxi):
-        results = []
+    def live_before(self, key):
+        # ultimo registro vivo con clave < key: se ancla en un registro vivo del principal
+        # con clave menor (busqueda binaria) y se camina la cadena hacia adelante desde ahi
+        pos = self.binary_search(key)
+        record = None
+        while pos != -1:
+            record = self.get_record_at(False, pos)
+            if not record.deleted and record.key() < key:
+                break
+            pos -= 1
+        if pos == -1:
+            start_pos, start_aux = self.get_start()
+            record = self.get_record_at(start_aux, start_pos)
+            if record is not None and record.deleted:
+                record = self.next_live(record)
+
+        last = None
+        while record is not None and record.key() < key:
+            last = record
+            record = self.next_live(record)
+        return last
+
+    def cursor(self, key=float("-inf")):
+        return SequentialCursor(self).seek(key)
+
+    def iter_range(self, mini, maxi):
+        for record in self.cursor(mini):
+            if not record.is_smaller(maxi):
+                return
+            yield record
 
-        left_pos = self.binary_search(mini)
-        left = self.get_record_at(False, left_pos)
+    def search_range(self, mini, maxi):
+        return list(self.iter_range(mini, maxi))
+
+    def aggregate_range(self, mini, maxi, ops=("count",)):
+        # recorre la cadena sobre bytes crudos: solo lee clave, enlaces y (cant, price)
+        def values():
+            pos, aux = self.find_prev(mini)[3:5]
+            while pos != -1:
+                data = self.get_raw_at(aux, pos)
+                if data is None:
+                    break
+                key = raw_key(data)
+                if key > maxi:
+                    break
+                next_pos, deleted, next_aux = struct.unpack_from("i??", data, NEXT_OFFSET)
+                if not deleted and key >= mini:
+                    yield struct.unpack_from("if", data, VALUES_OFFSET)
+                pos, aux = next_pos, next_aux
 
-        while left.is_smaller(maxi):
-            if left.id >= mini:
-                results.append(left)
-            left = self.get_record_at(left.aux, left.next)
+            lo = bisect.bisect_left(self.memtable_keys, mini)
+            hi = bisect.bisect_right(self.memtable_keys, maxi)
+            for record in self.memtable[lo:hi]:
+                yield record.cant, record.price
 
-        return results
+        return aggregate(values(), ops)
 
     def delete(self, key):
-        start_pos, start_aux = self.get_start()
-        if start_pos == -1:
+        i = self.find_in_memtable(key)
+        if i != -1:
+            del self.memtable_keys[i]
+            del self.memtable[i]
+            return True
+        if key not in self.bloom:
             return False
 
-        prev_pos = -1
-        prev_aux = False
-        current_pos = start_pos
-        current_aux = start_aux
-
-        while current_pos != -1:
-            record = self.get_record_at(current_aux, current_pos)
-            if not record:
-                break
-
-            if record.id == key and not record.deleted:
-                record.deleted = True
-                self.write_record_at(record, current_pos, current_aux)
-
-                if prev_pos == -1: 
-                    self.write_start(record.next, record.aux)
-                else:
-                    prev_record = self.get_record_at(prev_aux, prev_pos)
-                    if prev_record:
-                        prev_record.next = record.next
-                        prev_record.aux = record.aux
-                        self.write_record_at(prev_record, prev_pos, prev_aux)
-                return True
+        prev_pos, prev_aux, prev_record, current_pos, current_aux, record = self.find_prev(key)
+        if record is None or record.id != key:
+            return False
 
-            prev_pos = current_pos
-            prev_aux = current_aux
-            current_pos = record.next
-            current_aux = record.aux
+        record.deleted = True
+        self.write_record_at(record, current_pos, current_aux)
+        if self.defer_delete:
+            return True
 
-        return False
+        if prev_record is None:
+            self.write_start(record.next, record.aux)
+        else:
+            prev_record.next = record.next
+            prev_record.aux = record.aux
+            self.write_record_at(prev_record, prev_pos, prev_aux)
+        return True
 
 def medir_tiempos_por_cantidad(se, rows, cantidades):
     tiempos_insert = []
@@ -397,6 +921,7 @@ def medir_tiempos_por_cantidad(se, rows, cantidades):
     for n in cantidades:
         sample = rows[:n]
 
+        se.close()
         if os.path.exists("sequential.dat"):
             os.remove("sequential.dat")
         se = Sequential("sequential.dat")
@@ -428,7 +953,9 @@ def medir_tiempos_por_cantidad(se, rows, cantidades):
             se.delete(i)
         t2 = time.time()
         tiempos_delete.append(t2 - t1)
+        print(f"n = {n} -> {se.rebuild_stats}")
 
+    se.close()
     return tiempos_insert, tiempos_busqueda, tiempos_rango, tiempos_delete
 
 def graficar_lineal(cantidades, tiempos, titulo, nombre_archivo):
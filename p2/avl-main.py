@@ -1,20 +1,84 @@
 import struct
 import os
-import pandas as pd
+import re
+import numpy as np
 import csv
 import time
 import matplotlib.pyplot as plt
+from collections import OrderedDict
 
 RECORD_SIZE = struct.calcsize("i30sif10s")
-NODE_SIZE = struct.calcsize("iii") + RECORD_SIZE
+# enlaces del nodo: left, right, height y tamano del subarbol
+NODE_FORMAT = "iiii"
+NODE_SIZE = struct.calcsize(NODE_FORMAT) + RECORD_SIZE
+# offsets dentro del nodo para leer clave y (cant, price) sin decodificar el registro
+KEY_OFFSET = struct.calcsize(NODE_FORMAT)
+VALUES_OFFSET = KEY_OFFSET + struct.calcsize("i30si") - 4
+# el mismo layout que NODE_FORMAT + "i30sif10s" como dtype estructurado, para (de)codificar
+# bloques enteros de nodos; RAW_DTYPE es el nodo como bytes opacos (numpy no copia el
+# relleno entre campos, asi que filtrar/reordenar se hace sobre esa vista)
+NODE_DTYPE = np.dtype({
+    "names": ["left", "right", "height", "size", "id", "name", "cant", "price", "date"],
+    "formats": ["i4", "i4", "i4", "i4", "i4", "S30", "i4", "f4", "S10"],
+    "offsets": [0, 4, 8, 12, KEY_OFFSET, KEY_OFFSET + 4, VALUES_OFFSET, VALUES_OFFSET + 4,
+                KEY_OFFSET + struct.calcsize("i30sif")],
+    "itemsize": NODE_SIZE,
+})
+RAW_DTYPE = np.dtype((np.void, NODE_SIZE))
+# nodos por bloque al recorrer el archivo completo
+BLOCK_NODES = 4096
+# campos que acepta aggregate_range (indice dentro de la tupla (cant, price))
+AGG_FIELDS = {"cantidad": 0, "cant": 0, "precio": 1, "price": 1}
+AGG_PATTERN = re.compile(r"(sum|min|max|avg)\((\w+)(?:\*(\w+))?\)")
+# cabecera: raiz, cabeza de la lista de slots libres y si los tamanos de subarbol estan al dia
+HEADER_FORMAT = "iii"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# un slot libre se marca con altura -1 y guarda el siguiente libre en left
+FREE_HEIGHT = -1
+# orden de los nodos al reescribir el archivo (compact/bulk_load): "preorder" o
+# "veb" (van Emde Boas: los subarboles que se recorren juntos quedan contiguos)
+LAYOUT = "preorder"
+LAYOUTS = ("preorder", "veb")
+# presupuesto del buffer pool de nodos (en bytes de disco)
+BUFFER_POOL_BYTES = 1 << 20
 
 class Record:
+        # name y date pueden quedar como los bytes leidos del archivo: se decodifican recien
+        # cuando alguien los lee, asi bajar por el arbol comparando claves no paga el decode
+        __slots__ = ("id", "_name", "cant", "price", "_date")
+
         def __init__(self, id, name, cant, price, date):
             self.id = id # int
-            self.name = name # 30s
+            self._name = name # 30s
             self.cant = cant # int
             self.price = price # float
-            self.date = date # 10s
+            self._date = date # 10s
+
+        @property
+        def name(self):
+            if isinstance(self._name, bytes):
+                self._name = self._name.decode().strip()
+            return self._name
+
+        @name.setter
+        def name(self, value):
+            self._name = value
+
+        @property
+        def date(self):
+            if isinstance(self._date, bytes):
+                self._date = self._date.decode().strip()
+            return self._date
+
+        @date.setter
+        def date(self, value):
+            self._date = value
+
+        def name_bytes(self):
+            return self._name if isinstance(self._name, bytes) else self._name.encode()
+
+        def date_bytes(self):
+            return self._date if isinstance(self._date, bytes) else self._date.encode()
 
         def __str__(self):
             return f'{self.id} |  {self.name} | {self.cant} | {self.price} | {self.date}'
@@ -23,49 +87,224 @@ class Record:
             return self.id
         
         def to_binary(self):
-            return struct.pack('i30sif10s', self.id, self.name.encode(), self.cant, self.price, self.date.encode())
+            return struct.pack('i30sif10s', self.id, self.name_bytes(), self.cant, self.price, self.date_bytes())
 
         @staticmethod
         def from_binary(data):
             id, name, cant, price, date = struct.unpack('i30sif10s', data)
-            return Record(id, name.decode().strip(), cant, price, date.decode().strip()) 
+            return Record(id, name, cant, price, date)
         
 class Node:
-    def __init__(self, record, height = 0, left = -1, right = -1):
+    def __init__(self, record, height = 0, left = -1, right = -1, size = 1):
         self.record = record
         self.height = height
         self.left = left
         self.right = right
+        self.size = size
 
     def __str__(self):
-        return f'Record: {self.record} \n Left: {self.left} | Right: {self.right} | Height: {self.height}'
+        return f'Record: {self.record} \n Left: {self.left} | Right: {self.right} | Height: {self.height} | Size: {self.size}'
 
     def to_binary(self):
-        header = struct.pack("iii", self.left, self.right, self.height)
+        header = struct.pack(NODE_FORMAT, self.left, self.right, self.height, self.size)
         rec = self.record.to_binary()
         return header + rec
     
     @staticmethod
     def from_binary(data):
-        left, right, height = struct.unpack("iii", data[:12])
-        record = Record.from_binary(data[12:])
-        return Node(record=record, left=left, right=right, height=height)
+        links = struct.calcsize(NODE_FORMAT)
+        left, right, height, size = struct.unpack(NODE_FORMAT, data[:links])
+        record = Record.from_binary(data[links:])
+        return Node(record=record, left=left, right=right, height=height, size=size)
     
     def key(self):
         return self.record.id
 
 
+def encode_records(records):
+    block = np.zeros(len(records), dtype=NODE_DTYPE)
+    block["id"] = [record.id for record in records]
+    block["name"] = [record.name_bytes() for record in records]
+    block["cant"] = [record.cant for record in records]
+    block["price"] = [record.price for record in records]
+    block["date"] = [record.date_bytes() for record in records]
+    return block
+
+def take(block, index):
+    return block.view(RAW_DTYPE)[index].view(NODE_DTYPE)
+
+def preorder_order(root, left, right):
+    order = []
+    stack = [root] if root != -1 else []
+    while stack:
+        pos = stack.pop()
+        order.append(pos)
+        if right[pos] != -1:
+            stack.append(right[pos])
+        if left[pos] != -1:
+            stack.append(left[pos])
+    return order
+
+def veb_order(root, left, right, levels, order=None):
+    # parte el subarbol de `levels` niveles en una copa superior de levels // 2 niveles
+    # y los subarboles que cuelgan de ella; cada parte se ubica contigua y recursivamente
+    if order is None:
+        order = []
+    if root == -1:
+        return order
+    if levels == 1:
+        order.append(root)
+        return order
+    top = levels // 2
+    veb_order(root, left, right, top, order)
+    frontier = [root]
+    for _ in range(top):
+        frontier = [c for pos in frontier for c in (left[pos], right[pos]) if c != -1]
+    for pos in frontier:
+        veb_order(pos, left, right, levels - top, order)
+    return order
+
+def layout_order(layout, root, left, right, height):
+    if layout == "veb":
+        return veb_order(root, left, right, height + 1) if root != -1 else []
+    return preorder_order(root, left, right)
+
+def parse_aggregates(ops):
+    # "count", "sum(cantidad)", "sum(cantidad*precio)", "min(precio)", "max(precio)", "avg(...)"
+    plan = []
+    for op in ops:
+        expr = op.replace(" ", "")
+        if expr == "count":
+            plan.append(("count", ()))
+            continue
+        match = AGG_PATTERN.fullmatch(expr)
+        names = [name for name in match.groups()[1:] if name is not None] if match else []
+        if not match or any(name not in AGG_FIELDS for name in names):
+            raise ValueError(f"unsupported aggregate: {op}")
+        plan.append((match.group(1), tuple(AGG_FIELDS[name] for name in names)))
+    return plan
+
+def aggregate(values, ops):
+    # values: tuplas (cant, price) leidas directo de los bytes; devuelve {op: resultado}
+    plan = parse_aggregates(ops)
+    count = 0
+    acc = [None] * len(plan)
+    for row in values:
+        count += 1
+        for i, (kind, fields) in enumerate(plan):
+            if kind == "count":
+                continue
+            value = row[fields[0]] if len(fields) == 1 else row[fields[0]] * row[fields[1]]
+            current = acc[i]
+            if current is None:
+                acc[i] = value
+            elif kind in ("sum", "avg"):
+                acc[i] = current + value
+            elif (value < current) if kind == "min" else (value > current):
+                acc[i] = value
+
+    result = {}
+    for op, (kind, _), value in zip(ops, plan, acc):
+        if kind == "count":
+            result[op] = count
+        elif kind == "sum":
+            result[op] = value if value is not None else 0
+        elif kind == "avg":
+            result[op] = value / count if count else None
+        else:
+            result[op] = value
+    return result
+
+
+class AVLCursor:
+    # cursor entre dos registros: next() devuelve el de la derecha y avanza, prev() el de
+    # la izquierda y retrocede. Guarda solo el camino desde la raiz hasta el registro de la
+    # derecha (None = al final), asi que usa memoria O(altura). Se invalida si el arbol cambia
+    def __init__(self, tree):
+        self.tree = tree
+        self.path = None
+
+    def seek(self, key):
+        # se ubica antes del primer registro con clave >= key
+        self.tree.get_root()
+        path = []
+        found = 0
+        pos = self.tree.root
+        while pos != -1:
+            node = self.tree.get_node_at(pos)
+            path.append(pos)
+            if node.key() >= key:
+                found = len(path)
+                pos = node.left
+            else:
+                pos = node.right
+        self.path = path[:found] if found else None
+        return self
+
+    def _descend(self, path, pos, right):
+        # baja por el extremo izquierdo (o derecho) del subarbol de pos
+        while pos != -1:
+            path.append(pos)
+            node = self.tree.get_node_at(pos)
+            pos = node.right if right else node.left
+        return path
+
+    def _step(self, path, forward):
+        # sucesor (o predecesor) en orden del ultimo nodo del camino; None si no hay
+        path = list(path)
+        node = self.tree.get_node_at(path[-1])
+        child = node.right if forward else node.left
+        if child != -1:
+            return self._descend(path, child, not forward)
+        while len(path) > 1:
+            pos = path.pop()
+            parent = self.tree.get_node_at(path[-1])
+            if (parent.left if forward else parent.right) == pos:
+                return path
+        return None
+
+    def next(self):
+        if self.path is None:
+            return None
+        record = self.tree.get_node_at(self.path[-1]).record
+        self.path = self._step(self.path, True)
+        return record
+
+    def prev(self):
+        if self.path is None:
+            self.tree.get_root()
+            if self.tree.root == -1:
+                return None
+            path = self._descend([], self.tree.root, True)
+        else:
+            path = self._step(self.path, False)
+            if path is None:
+                return None
+        self.path = path
+        return self.tree.get_node_at(path[-1]).record
+
+    def __iter__(self):
+        record = self.next()
+        while record is not None:
+            yield record
+            record = self.next()
+
+
 import os
 import struct
 
 class AVLTree:
-    def __init__(self, filename):
+    def __init__(self, filename, pool_bytes=BUFFER_POOL_BYTES, layout=LAYOUT, order_stats=False):
+        if layout not in LAYOUTS:
+            raise ValueError(f"layout must be one of {LAYOUTS}")
         self.filename = filename
+        self.layout = layout
         root = -1
+        free_head = -1
+        stats = 0
         if not os.path.exists(filename):
             with open(filename, "wb") as f:
-                f.write(struct.pack("i", -1))
-            self.root = -1
+                f.write(struct.pack(HEADER_FORMAT, -1, -1, int(order_stats)))
         else:
             with open(filename, "rb+") as f:
                 f.seek(0, os.SEEK_END)
@@ -73,40 +312,201 @@ class AVLTree:
 
                 if file_size != 0:
                     f.seek(0)
-                    root = struct.unpack("i", f.read(4))[0]
+                    root, free_head, stats = struct.unpack(HEADER_FORMAT, f.read(HEADER_SIZE))
                 else:
                     f.seek(0)
-                    f.write(struct.pack("i", -1))
-            self.root = root
+                    f.write(struct.pack(HEADER_FORMAT, -1, -1, int(order_stats)))
+        self.root = root
+        self.free_head = free_head
+
+        self.f = open(filename, "rb+")
+        self.f.seek(0, os.SEEK_END)
+        self.num_nodes = (self.f.tell() - HEADER_SIZE) // NODE_SIZE
+        # buffer pool: nodos decodificados por posicion en orden LRU; los sucios se
+        # escriben al desalojarlos o en flush()/close()
+        self.pool = OrderedDict()
+        self.dirty = set()
+        self.pool_capacity = max(1, pool_bytes // NODE_SIZE)
+        self.root_dirty = False
+        # con order_stats cada nodo mantiene el tamano de su subarbol (count_range, rank,
+        # select en O(log n)); a cambio insert/remove reescriben todo el camino a la raiz
+        self.order_stats = order_stats
+        if order_stats and not stats and root != -1:
+            self._rebuild_sizes()
+        elif bool(order_stats) != bool(stats):
+            self.root_dirty = True
+
+    def flush(self):
+        for pos in sorted(self.dirty):
+            self.f.seek(pos * NODE_SIZE + HEADER_SIZE)
+            self.f.write(self.pool[pos].to_binary())
+        self.dirty.clear()
+        if self.root_dirty:
+            self.f.seek(0)
+            self.f.write(struct.pack(HEADER_FORMAT, self.root, self.free_head, int(self.order_stats)))
+            self.root_dirty = False
+        self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.flush()
+            self.f.close()
+            self.f = None
+        self.pool.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _pool_put(self, pos, node):
+        self.pool[pos] = node
+        self.pool.move_to_end(pos)
+        while len(self.pool) > self.pool_capacity:
+            old_pos, old_node = self.pool.popitem(last=False)
+            if old_pos in self.dirty:
+                self.f.seek(old_pos * NODE_SIZE + HEADER_SIZE)
+                self.f.write(old_node.to_binary())
+                self.dirty.discard(old_pos)
 
     def get_node_at(self, pos):
-        with open(self.filename, "rb+") as f:
-            f.seek(pos * NODE_SIZE + 4)
-            return Node.from_binary(f.read(NODE_SIZE))
+        node = self.pool.get(pos)
+        if node is not None:
+            self.pool.move_to_end(pos)
+            return node
+        self.f.seek(pos * NODE_SIZE + HEADER_SIZE)
+        node = Node.from_binary(self.f.read(NODE_SIZE))
+        self._pool_put(pos, node)
+        return node
     
     def write_node_at(self, node, pos):
-        with open(self.filename, "rb+") as f:
-            f.seek(0)
-            f.seek(pos * NODE_SIZE + 4)
-            f.write(node.to_binary())
+        self.dirty.add(pos)
+        self._pool_put(pos, node)
+        self.num_nodes = max(self.num_nodes, pos + 1)
     
     def get_root(self):
-        with open(self.filename, "rb+") as f:
-            f.seek(0)
-            self.root = struct.unpack("i", f.read(4))[0]
+        # la cabecera en memoria es la vigente mientras haya cambios sin escribir
+        if self.root_dirty:
+            return
+        self.f.seek(0)
+        self.root, self.free_head, _ = struct.unpack(HEADER_FORMAT, self.f.read(HEADER_SIZE))
     
     def write_root(self):
-        with open(self.filename, "rb+") as f:
-            f.seek(0)
-            f.write(struct.pack("i", self.root))
+        self.root_dirty = True
+
+    def _alloc_slot(self, changed):
+        # reutiliza el primer slot libre; si no hay, agrega al final del archivo
+        if self.free_head == -1:
+            return self.num_nodes
+        pos = self.free_head
+        self.free_head = self._node(pos, changed).left
+        return pos
+
+    def _free_slot(self, pos, changed):
+        changed[pos] = Node(Record(0, "", 0, 0.0, ""), FREE_HEIGHT, self.free_head, size=0)
+        self.free_head = pos
+
+    def free_slots(self):
+        self.get_root()
+        count = 0
+        pos = self.free_head
+        while pos != -1:
+            count += 1
+            pos = self.get_node_at(pos).left
+        return count
+
+    def compact(self):
+        # reescribe el arbol sin huecos segun self.layout (la raiz queda en el slot 0)
+        # y descarta la lista de libres
+        self.get_root()
+        nodes = self.read_nodes()
+        left = nodes["left"].tolist()
+        right = nodes["right"].tolist()
+        root_height = int(nodes["height"][self.root]) if self.root != -1 else -1
+        order = layout_order(self.layout, self.root, left, right, root_height)
+        self._write_nodes(take(nodes, order), order, len(nodes))
+
+    def read_nodes(self):
+        # todos los slots (incluidos los libres) en un solo arreglo, con lo del pool ya escrito
+        self.flush()
+        self.f.seek(HEADER_SIZE)
+        data = self.f.read(self.num_nodes * NODE_SIZE)
+        return np.frombuffer(data, dtype=NODE_DTYPE, count=len(data) // NODE_SIZE)
+
+    def _write_nodes(self, nodes, order, num_slots):
+        # nodes[i] va al slot i; order[i] es su posicion anterior, para reapuntar los enlaces
+        # new_pos lleva un elemento extra al final en -1: asi new_pos[-1] deja los -1 como estan
+        new_pos = np.full(num_slots + 1, -1, dtype=np.int32)
+        new_pos[order] = np.arange(len(order), dtype=np.int32)
+        nodes["left"] = new_pos[nodes["left"]]
+        nodes["right"] = new_pos[nodes["right"]]
+
+        tmp = self.filename + ".tmp"
+        with open(tmp, "wb") as out:
+            out.write(struct.pack(HEADER_FORMAT, 0 if len(nodes) else -1, -1, int(self.order_stats)))
+            out.write(nodes.tobytes())
+        self._replace_file(tmp, len(nodes))
+
+    def _replace_file(self, tmp, num_nodes):
+        # el archivo nuevo siempre queda denso, con la raiz en el slot 0 y sin libres
+        self.f.close()
+        os.replace(tmp, self.filename)
+        self.f = open(self.filename, "rb+")
+        self.pool.clear()
+        self.dirty.clear()
+        self.root = 0 if num_nodes else -1
+        self.free_head = -1
+        self.root_dirty = False
+        self.num_nodes = num_nodes
     
     def load(self, file_csv):
-        df = pd.read_csv(file_csv)
-
-        for index, row in df.iterrows():
-            record = Record(row.iloc[0], row.iloc[1], row.iloc[2], row.iloc[3], row.iloc[4])
-            self.insert(record)
-            print(f"inserted {record.key()}")
+        records = []
+        with open(file_csv, newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            next(reader)
+            for row in reader:
+                records.append(Record(int(row[0]), row[1], int(row[2]), float(row[3]), row[4]))
+        self.bulk_load(records)
+
+    def bulk_load(self, records):
+        # construye el arbol balanceado de abajo hacia arriba sobre los registros ordenados
+        # (mezclados con los que ya estaban) y lo escribe de una sola pasada segun self.layout
+        nodes = encode_records(records)
+        self.get_root()
+        if self.root != -1:
+            # en empates los que ya estaban quedan primero (argsort estable)
+            old = self.read_nodes()
+            old = take(old, old["height"] != FREE_HEIGHT)
+            nodes = np.concatenate([old.view(RAW_DTYPE), nodes.view(RAW_DTYPE)]).view(NODE_DTYPE)
+        nodes = take(nodes, np.argsort(nodes["id"], kind="stable"))
+
+        # arbol implicito sobre los indices: la mediana de cada rango es la raiz
+        n = len(nodes)
+        left = [-1] * n
+        right = [-1] * n
+        height = [0] * n
+        size_of = [1] * n
+        root = n // 2 if n else -1
+        stack = [(0, n)] if n else []
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            # con la mediana como raiz la altura depende solo del tamano del subarbol
+            height[mid] = (hi - lo).bit_length() - 1
+            size_of[mid] = hi - lo
+            if mid > lo:
+                left[mid] = (lo + mid) // 2
+                stack.append((lo, mid))
+            if hi > mid + 1:
+                right[mid] = (mid + 1 + hi) // 2
+                stack.append((mid + 1, hi))
+        nodes["left"] = left
+        nodes["right"] = right
+        nodes["height"] = height
+        nodes["size"] = size_of
+        order = layout_order(self.layout, root, left, right, height[root] if n else -1)
+        self._write_nodes(take(nodes, order), order, n)
 
     def insert(self, record):
         self.get_root()
@@ -114,116 +514,132 @@ class AVLTree:
         self.write_root()
 
     def _insert(self, node_pos, record):
-        if node_pos == -1:
-            with open(self.filename, "ab+") as f:
-                pos = (f.tell() - 4) // NODE_SIZE  # Assuming 4 bytes for metadata or header
-                self.write_node_at(Node(record), pos)
-                return pos
+        # bajada iterativa guardando el camino; alturas y rotaciones se resuelven en
+        # memoria y cada nodo modificado se escribe una sola vez al final
+        changed = {}
+        path = []
+        pos = node_pos
+        while pos != -1:
+            node = self._node(pos, changed)
+            path.append((pos, node))
+            pos = node.left if record.key() < node.key() else node.right
+
+        child = self._alloc_slot(changed)
+        changed[child] = Node(record)
+        new_root = self._fix_path(path, child, changed, node_pos)
+        self._write_changed(changed)
+        return new_root
+
+    def _fix_path(self, path, child, changed, node_pos, next_pos=None, keep=-1):
+        # sube por el camino enganchando el nuevo hijo y rebalanceando; si un nodo queda
+        # igual (mismos hijos y altura) sus ancestros tampoco cambian y se corta ahi
+        for i in range(len(path) - 1, -1, -1):
+            pos, node = path[i]
+            old = (node.left, node.right, node.height, node.size)
+            below = path[i + 1][0] if i + 1 < len(path) else next_pos
+            if below is None:
+                if child is not None and changed[child].key() < node.key():
+                    node.left = child
+                else:
+                    node.right = child
+            elif node.left == below:
+                node.left = child
+            else:
+                node.right = child
+            changed[pos] = node
+            child = self._rebalance(pos, node, changed)
+            if child == pos and (node.left, node.right, node.height, node.size) == old:
+                if pos != keep:
+                    del changed[pos]
+                return node_pos
+        return child
+
+    def _node(self, pos, changed):
+        # los nodos ya tocados en esta operacion tienen prioridad sobre el buffer pool
+        node = changed.get(pos)
+        return node if node is not None else self.get_node_at(pos)
+
+    def _height(self, pos, changed):
+        if pos == -1:
+            return -1
+        return self._node(pos, changed).height
 
-        node = self.get_node_at(node_pos)
-        if record.key() < node.key():
-            node.left = self._insert(node.left, record)
-        else:
-            node.right = self._insert(node.right, record)
+    def _subtree_size(self, pos, changed):
+        if pos == -1:
+            return 0
+        return self._node(pos, changed).size
+
+    def _update_height(self, node, changed):
+        node.height = 1 + max(self._height(node.left, changed), self._height(node.right, changed))
+        if self.order_stats:
+            node.size = 1 + self._subtree_size(node.left, changed) + self._subtree_size(node.right, changed)
+
+    def _write_changed(self, changed):
+        for pos in sorted(changed):
+            self.write_node_at(changed[pos], pos)
+
+    def _rebalance(self, pos, node, changed):
+        self._update_height(node, changed)
+        balance = self._height(node.left, changed) - self._height(node.right, changed)
 
-        node.height = 1 + max(self._get_height(node.left), self._get_height(node.right))
-        self.write_node_at(node, node_pos)
-        balance = self._get_balance(node_pos)
-        # Rotations based on balance factor
         if balance > 1:  # Left heavy
-            left_node = self.get_node_at(node.left)
-            if record.key() < left_node.key():  # Left-Left case
-                self.write_node_at(node, node_pos)
-                return self._right_rotate(node_pos)
-            else:  # Left-Right case
-                node.left = self._left_rotate(node.left)
-                self.write_node_at(node, node_pos)
-                return self._right_rotate(node_pos)
+            left = self._node(node.left, changed)
+            if self._height(left.left, changed) < self._height(left.right, changed):  # Left-Right case
+                node.left = self._left_rotate(node.left, left, changed)
+            return self._right_rotate(pos, node, changed)
 
         if balance < -1:  # Right heavy
-            right_node = self.get_node_at(node.right)
-            if record.key() > right_node.key():  # Right-Right case
-                self.write_node_at(node, node_pos)
-                return self._left_rotate(node_pos)
-            else:  # Right-Left case
-                node.right = self._right_rotate(node.right)
-                self.write_node_at(node, node_pos)
-                return self._left_rotate(node_pos)
+            right = self._node(node.right, changed)
+            if self._height(right.right, changed) < self._height(right.left, changed):  # Right-Left case
+                node.right = self._right_rotate(node.right, right, changed)
+            return self._left_rotate(pos, node, changed)
 
+        return pos
 
-        self.write_node_at(node, node_pos)
-        return node_pos
-
-    def _left_rotate(self, z_pos):
-        z = self.get_node_at(z_pos)
+    def _left_rotate(self, z_pos, z, changed):
         y_pos = z.right
-        y = self.get_node_at(y_pos)
-        T2 = y.left
+        y = self._node(y_pos, changed)
 
         # Perform rotation
+        z.right = y.left  # T2 becomes the right child of z
         y.left = z_pos  # z becomes the left child of y
-        z.right = T2  # T2 becomes the right child of z
 
         # Update heights after the rotation
-        z.height = 1 + max(self._get_height(z.left), self._get_height(z.right))
-        self.write_node_at(z, z_pos)
-        y.height = 1 + max(self._get_height(y.left), self._get_height(y.right))
-        # Write the nodes back to their positions in the file
-        self.write_node_at(y, y_pos)
+        self._update_height(z, changed)
+        self._update_height(y, changed)
+        changed[z_pos] = z
+        changed[y_pos] = y
 
         return y_pos  # Return the new root of the subtree
 
-    def _right_rotate(self, z_pos):
-        z = self.get_node_at(z_pos)
+    def _right_rotate(self, z_pos, z, changed):
         y_pos = z.left
-        y = self.get_node_at(y_pos)
-        T3 = y.right
+        y = self._node(y_pos, changed)
 
         # Perform rotation
+        z.left = y.right  # T3 becomes the left child of z
         y.right = z_pos  # z becomes the right child of y
-        z.left = T3  # T3 becomes the left child of z
-        # Update heights after the rotation
-        z.height = 1 + max(self._get_height(z.left), self._get_height(z.right))
-        self.write_node_at(z, z_pos)
-        y.height = 1 + max(self._get_height(y.left), self._get_height(y.right))
 
-        # Write the nodes back to their positions in the file
-        self.write_node_at(y, y_pos)
-        self.write_node_at(z, z_pos)
+        # Update heights after the rotation
+        self._update_height(z, changed)
+        self._update_height(y, changed)
+        changed[z_pos] = z
+        changed[y_pos] = y
 
         return y_pos  # Return the new root of the subtree
         
     def print_file(self):
-        with open(self.filename, "ab+") as f:
-            end = f.tell()
-            i = 0
-            while i * NODE_SIZE + 4 < end:
-                data = self.get_node_at(i)
-                print(data)
-                i+=1
-
-    def _balance(self, node_pos):
-        if node_pos == -1:
-            return node_pos
-
-        balance = self._get_balance(node_pos)
-        node = self.get_node_at(node_pos)
+        self.flush()
+        self.f.seek(HEADER_SIZE)
+        while True:
+            data = self.f.read(BLOCK_NODES * NODE_SIZE)
+            if len(data) < NODE_SIZE:
+                break
+            for left, right, height, size, id, name, cant, price, date in np.frombuffer(
+                    data, dtype=NODE_DTYPE, count=len(data) // NODE_SIZE).tolist():
+                if height != FREE_HEIGHT:
+                    print(Node(Record(id, name, cant, price, date), height, left, right, size))
 
-        if balance > 1:
-            if self._get_balance(node.left) < 0:
-                node.left = self._left_rotate(node.left)
-                self.write_node_at(node, node_pos)
-            return self._right_rotate(node_pos)
-
-        if balance < -1:
-            if self._get_balance(node.right) > 0:
-                node.right = self._right_rotate(node.right)
-                self.write_node_at(node, node_pos)
-            return self._left_rotate(node_pos)
-
-        self.write_node_at(node, node_pos)
-        return node_pos
-    
     def _get_height(self, node_pos):
         if node_pos != -1:
             node = self.get_node_at(node_pos)
@@ -248,23 +664,48 @@ class AVLTree:
         else:
             return self._find(node.right, value)
         
-    def search_rango(self, mini, maxi):
-        self.get_root()
-        result = []
-        self._search_rango(self.root, mini, maxi, result)
-        return result
+    def cursor(self, key=float("-inf")):
+        return AVLCursor(self).seek(key)
 
-    def _search_rango(self, node_pos, mini, maxi, result):
-        if node_pos == -1:
-            return
-        node = self.get_node_at(node_pos)
-        key = node.key()
-        if mini < key:
-            self._search_rango(node.left, mini, maxi, result)
-        if mini <= key <= maxi:
-            result.append(node.record)
-        if key < maxi:
-            self._search_rango(node.right, mini, maxi, result)
+    def iter_range(self, mini, maxi):
+        for record in self.cursor(mini):
+            if record.key() > maxi:
+                return
+            yield record
+
+    def search_rango(self, mini, maxi):
+        return list(self.iter_range(mini, maxi))
+
+    def aggregate_range(self, mini, maxi, ops=("count",)):
+        # con tamanos de subarbol un count sale de dos caminos raiz-hoja
+        if self.order_stats and all(op.replace(" ", "") == "count" for op in ops):
+            return {op: self.count_range(mini, maxi) for op in ops}
+
+        # recorrido con poda (el orden no importa): los nodos que no estan en el buffer
+        # pool se leen crudos, solo enlaces, clave y (cant, price), sin crear Record
+        def values():
+            self.get_root()
+            stack = [self.root] if self.root != -1 else []
+            while stack:
+                pos = stack.pop()
+                node = self.pool.get(pos)
+                if node is not None:
+                    left, right, key = node.left, node.right, node.key()
+                    if mini <= key <= maxi:
+                        yield node.record.cant, node.record.price
+                else:
+                    self.f.seek(pos * NODE_SIZE + HEADER_SIZE)
+                    data = self.f.read(NODE_SIZE)
+                    left, right = struct.unpack_from("ii", data)
+                    key = struct.unpack_from("i", data, KEY_OFFSET)[0]
+                    if mini <= key <= maxi:
+                        yield struct.unpack_from("if", data, VALUES_OFFSET)
+                if key <= maxi and right != -1:
+                    stack.append(right)
+                if key >= mini and left != -1:
+                    stack.append(left)
+
+        return aggregate(values(), ops)
 
     def get_preorder(self):
         return self._get_preorder(self.root)
@@ -314,12 +755,78 @@ class AVLTree:
         return abs(balance) <= 1 and self._is_balanced(node.left) and self._is_balanced(node.right)
 
     def size(self):
-        return self._size(self.root)
+        self.get_root()
+        if self.order_stats:
+            return self._subtree_size(self.root, {})
+        count = 0
+        stack = [self.root] if self.root != -1 else []
+        while stack:
+            node = self.get_node_at(stack.pop())
+            count += 1
+            stack.extend(c for c in (node.left, node.right) if c != -1)
+        return count
+
+    def _rebuild_sizes(self):
+        # recalcula los tamanos en postorden (archivo creado sin order_stats)
+        self.get_root()
+        stack = [(self.root, False)]
+        while stack:
+            pos, visited = stack.pop()
+            node = self.get_node_at(pos)
+            if visited:
+                node.size = 1 + self._subtree_size(node.left, {}) + self._subtree_size(node.right, {})
+                self.write_node_at(node, pos)
+                continue
+            stack.append((pos, True))
+            stack.extend((c, False) for c in (node.left, node.right) if c != -1)
+        self.root_dirty = True
+
+    def _count_below(self, key, inclusive):
+        # cantidad de claves < key (o <= key) bajando por un solo camino
+        count = 0
+        pos = self.root
+        while pos != -1:
+            node = self.get_node_at(pos)
+            if node.key() < key or (inclusive and node.key() == key):
+                count += self._subtree_size(node.left, {}) + 1
+                pos = node.right
+            else:
+                pos = node.left
+        return count
 
-    def _size(self, node):
-        if node is None:
+    def count_range(self, mini, maxi):
+        if not self.order_stats:
+            return len(self.search_rango(mini, maxi))
+        self.get_root()
+        if mini > maxi:
             return 0
-        return 1 + self._size(node.left) + self._size(node.right)
+        return self._count_below(maxi, True) - self._count_below(mini, False)
+
+    def rank(self, key):
+        # cantidad de registros con clave menor a key
+        if not self.order_stats:
+            return sum(1 for r in self.search_rango(float("-inf"), key) if r.key() < key)
+        self.get_root()
+        return self._count_below(key, False)
+
+    def select(self, k):
+        # k-esimo registro en orden de clave (desde 0); None si k esta fuera de rango
+        if not self.order_stats:
+            records = self.search_rango(float("-inf"), float("inf"))
+            return records[k] if 0 <= k < len(records) else None
+        self.get_root()
+        pos = self.root
+        while pos != -1:
+            node = self.get_node_at(pos)
+            left_size = self._subtree_size(node.left, {})
+            if k < left_size:
+                pos = node.left
+            elif k == left_size:
+                return node.record
+            else:
+                k -= left_size + 1
+                pos = node.right
+        return None
 
     def remove(self, value):
         self.get_root()
@@ -328,35 +835,46 @@ class AVLTree:
 
 
     def _remove(self, node_pos, value):
-        if node_pos == -1:
-            return -1
-
-        node = self.get_node_at(node_pos)
+        changed = {}
+        path = []
+        pos = node_pos
+        while pos != -1:
+            node = self._node(pos, changed)
+            if value == node.key():
+                break
+            path.append((pos, node))
+            pos = node.left if value < node.key() else node.right
+
+        if pos == -1:
+            return node_pos
 
-        if value < node.key():
-            node.left = self._remove(node.left, value)
-        elif value > node.key():
-            node.right = self._remove(node.right, value)
+        keep = -1
+        # Caso 1 y 2: Nodo sin hijos o con un hijo
+        if node.left == -1 or node.right == -1:
+            replacement = node.left if node.left != -1 else node.right
+            removed_pos = pos
+        # Caso 3: Nodo con dos hijos, se reemplaza por el maximo del subarbol izquierdo
         else:
-            # Caso 1: Nodo con solo un hijo o sin hijos
-            if node.left == -1 and node.right == -1:
-                return -1
-            # Caso 2: Nodo con un hijo
-            elif node.left == -1:
-                return node.right
-            elif node.right == -1:
-                return node.left
-            # Caso 3: Nodo con dos hijos
-            else:
-                max_node = self.get_node_at(self._max_node_pos(node.left))
-                node.record = max_node.record
-                node.left = self._remove(node.left, max_node.key())
-
-
-        # Actualizamos la altura y balanceamos el nodo
-        node.height = 1 + max(self._get_height(node.left), self._get_height(node.right))
-        self.write_node_at(node, node_pos)
-        return self._balance(node_pos)
+            keep = pos
+            changed[pos] = node
+            path.append((pos, node))
+            max_pos = node.left
+            max_node = self._node(max_pos, changed)
+            while max_node.right != -1:
+                path.append((max_pos, max_node))
+                max_pos = max_node.right
+                max_node = self._node(max_pos, changed)
+            node.record = max_node.record
+            replacement = max_node.left
+            removed_pos = max_pos
+
+        # Actualizamos alturas y balanceamos hacia arriba
+        new_root = self._fix_path(path, replacement, changed, node_pos, removed_pos, keep)
+        if not path:
+            new_root = replacement
+        self._free_slot(removed_pos, changed)
+        self._write_changed(changed)
+        return new_root
 
 
     def display_pretty(self):
@@ -379,6 +897,7 @@ def medir_tiempos_por_cantidad(avl, rows, cantidades):
     for n in cantidades:
         sample = rows[:n]
 
+        avl.close()
         if os.path.exists("avl.dat"):
             os.remove("avl.dat")
         avl = AVLTree("avl.dat")
@@ -411,6 +930,7 @@ def medir_tiempos_por_cantidad(avl, rows, cantidades):
         t2 = time.time()
         tiempos_delete.append(t2 - t1)
 
+    avl.close()
     return tiempos_insert, tiempos_busqueda, tiempos_rango, tiempos_delete
 
 def graficar_lineal(cantidades, tiempos, titulo, nombre_archivo):